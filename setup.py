@@ -23,5 +23,8 @@ setuptools.setup(
     install_requires=[
         'colorlog'
     ],
+    extras_require={
+        'numpy': ['numpy'],
+    },
     python_requires='>=3.6',
 )
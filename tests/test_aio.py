@@ -0,0 +1,46 @@
+import asyncio
+
+from tests.tsgen import make_stream
+from tsdemux.aio import AsyncTsDemuxer
+from tsdemux.es import Es
+
+
+async def demux_tcp(data: bytes, chunk_size: int, **kwargs) -> list:
+    """Serve data on a loopback tcp socket and demux it as it is received"""
+
+    async def send(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        for offset in range(0, len(data), chunk_size):
+            writer.write(data[offset:offset + chunk_size])
+            await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(send, "127.0.0.1", 0)
+    try:
+        reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+        demuxer = AsyncTsDemuxer(**kwargs)
+        task = asyncio.ensure_future(demuxer.run(reader))
+        pes_packets = [pes_packet async for pes_packet in demuxer]
+        await task
+        writer.close()
+    finally:
+        server.close()
+        await server.wait_closed()
+    return pes_packets
+
+
+def test_tcp_feeder():
+    muxer = make_stream(programs=2)
+    pes_packets = asyncio.run(demux_tcp(muxer.data, 1000))
+
+    by_pid = {}
+    for pes_packet in pes_packets:
+        assert pes_packet.program_id == pes_packet.pid >> 8
+        assert not pes_packet.scrambled
+        by_pid.setdefault(pes_packet.pid, []).append((pes_packet.pts, pes_packet.data))
+    assert by_pid == muxer.pes_packets
+
+
+def test_tcp_feeder_media_types():
+    muxer = make_stream()
+    pes_packets = asyncio.run(demux_tcp(muxer.data, 4096, media_types={Es.MEDIA_TYPE_AUDIO}))
+    assert [(pes_packet.pts, pes_packet.data) for pes_packet in pes_packets] == muxer.pes_packets[0x102]
@@ -0,0 +1,149 @@
+import io
+import random
+
+import pytest
+
+from tests.tsgen import PesCollector, TS_PKT_LEN, m2ts, make_stream, random_bytes, reed_solomon
+
+VECTORIZED = [False, pytest.param(True, id="vectorized")]
+
+
+@pytest.fixture(params=VECTORIZED)
+def vectorized(request):
+    if request.param:
+        pytest.importorskip("numpy")
+    return request.param
+
+
+def parse(data: bytes, vectorized: bool = False, **kwargs) -> PesCollector:
+    parser = PesCollector(**kwargs)
+    parser.parse(io.BytesIO(data), vectorized=vectorized)
+    return parser
+
+
+def test_pes_round_trip(vectorized):
+    muxer = make_stream(programs=2)
+    parser = parse(muxer.data, vectorized)
+    assert parser.pes_packets == muxer.pes_packets
+    assert parser.pkt_count == muxer.packet_count
+    assert parser.continuity_errors == 0
+    assert parser.corrupted_packets == 0
+
+
+def test_unbounded_pes_round_trip(vectorized):
+    muxer = make_stream(bounded_video=False)
+    parser = parse(muxer.data, vectorized)
+    # unbounded pes packets end at the start of the next one, the last one is never complete
+    assert parser.pes_packets[0x101] == muxer.pes_packets[0x101][:-1]
+    assert parser.pes_packets[0x102] == muxer.pes_packets[0x102]
+
+
+def test_vectorized_matches_scalar():
+    pytest.importorskip("numpy")
+    muxer = make_stream(programs=2)
+    data = bytearray(muxer.data)
+    # continuity error on the audio pid of program 1
+    data[100 * TS_PKT_LEN:101 * TS_PKT_LEN] = b""
+    scalar = parse(bytes(data))
+    vectorized = parse(bytes(data), vectorized=True)
+    assert vectorized.pes_packets == scalar.pes_packets
+    assert vectorized.pkt_count == scalar.pkt_count
+    assert vectorized.continuity_errors == scalar.continuity_errors == 1
+    assert vectorized.programs_pcr == scalar.programs_pcr
+
+
+def test_parse_file(tmp_path, vectorized):
+    muxer = make_stream()
+    path = tmp_path / "stream.ts"
+    path.write_bytes(muxer.data)
+    parser = PesCollector()
+    parser.parse_file(str(path), vectorized)
+    assert parser.pes_packets == muxer.pes_packets
+
+
+@pytest.mark.parametrize("block_size", [TS_PKT_LEN, 1000, TS_PKT_LEN * 64])
+def test_parse_block_sizes(block_size):
+    muxer = make_stream(frames=30)
+    parser = PesCollector()
+    parser.parse(io.BytesIO(muxer.data), block_size=block_size)
+    assert parser.pes_packets == muxer.pes_packets
+
+
+def test_read_ahead():
+    muxer = make_stream(frames=30)
+    parser = PesCollector()
+    parser.parse(io.BytesIO(muxer.data), block_size=TS_PKT_LEN * 7, read_ahead=2)
+    assert parser.pes_packets == muxer.pes_packets
+
+
+def test_feed(vectorized):
+    muxer = make_stream()
+    data = muxer.data
+    rnd = random.Random(1)
+    parser = PesCollector()
+    offset = 0
+    while offset < len(data):
+        # chunks smaller and larger than a packet
+        size = rnd.choice((1, 7, TS_PKT_LEN - 1, TS_PKT_LEN, 1316, 5000))
+        parser.feed(data[offset:offset + size], vectorized)
+        offset += size
+    parser.flush(vectorized)
+    assert parser.pes_packets == muxer.pes_packets
+    assert parser.pkt_count == muxer.packet_count
+    assert parser.continuity_errors == 0
+
+
+@pytest.mark.parametrize("convert, stride", [(m2ts, 192), (reed_solomon, 204)])
+def test_packet_strides(vectorized, convert, stride):
+    muxer = make_stream()
+    parser = parse(convert(muxer.data), vectorized)
+    assert parser.pkt_stride == stride
+    assert parser.pes_packets == muxer.pes_packets
+    assert parser.pkt_count == muxer.packet_count
+
+
+def test_m2ts_feed():
+    muxer = make_stream(frames=20)
+    data = m2ts(muxer.data)
+    parser = PesCollector()
+    for offset in range(0, len(data), 1000):
+        parser.feed(data[offset:offset + 1000])
+    parser.flush()
+    assert parser.pkt_stride == 192
+    assert parser.pes_packets == muxer.pes_packets
+
+
+def test_garbage_resync(vectorized):
+    muxer = make_stream(frames=60)
+    data = muxer.data
+    rnd = random.Random(2)
+    # no sync byte in the garbage
+    garbage = random_bytes(rnd, 1000).replace(b"\x47", b"\x00")
+    cut = 700 * TS_PKT_LEN
+    parser = parse(garbage + data[:cut] + garbage[:333] + data[cut:], vectorized)
+
+    assert parser.skipped_bytes > len(garbage)
+    assert parser.sync_locked
+    # only the pes packets spanning the garbage are damaged
+    for pid, pes_packets in muxer.pes_packets.items():
+        starts = [packet_idx for _, packet_idx, _ in muxer.pes_starts[pid]]
+        before = sum(packet_idx < 690 for packet_idx in starts) - 1
+        after = sum(packet_idx > 705 for packet_idx in starts)
+        collected = parser.pes_packets[pid]
+        assert collected[:before] == pes_packets[:before]
+        assert collected[-after:] == pes_packets[-after:]
+
+
+def test_keyframes_only(vectorized):
+    muxer = make_stream()
+    parser = parse(muxer.data, vectorized, keyframes_only=True)
+    assert parser.pes_packets[0x101] == muxer.pes_packets[0x101][::25]
+    assert parser.pes_packets[0x102] == muxer.pes_packets[0x102]
+
+
+@pytest.mark.parametrize("bounded_video", [True, False])
+def test_keyframes_only_late_idr(bounded_video):
+    # no random access indicator, the IDR slice starts after the first ts packet of the pes packet
+    muxer = make_stream(random_access=False, parameter_sets=True, bounded_video=bounded_video)
+    parser = parse(muxer.data, keyframes_only=True)
+    assert parser.pes_packets[0x101] == muxer.pes_packets[0x101][::25]
@@ -0,0 +1,91 @@
+import io
+
+import pytest
+
+from tests.tsgen import FRAME_PCR, PesCollector, TS_PKT_LEN, m2ts, make_stream
+from tsdemux.demux import TsParser
+from tsdemux.index import TsIndex
+
+FORMATS = [(None, TS_PKT_LEN), (m2ts, 192)]
+
+
+def pcr_packet_at(muxer, time_ms: float) -> int:
+    """:returns index of the packet carrying the last pcr <= time_ms from the first one"""
+    first = muxer.pcr_packets[0][0]
+    return max(packet_idx for pcr, packet_idx in muxer.pcr_packets if (pcr - first) / 27000 <= time_ms)
+
+
+@pytest.fixture(scope="module")
+def muxer():
+    return make_stream(frames=200)
+
+
+@pytest.mark.parametrize("convert, stride", FORMATS)
+@pytest.mark.parametrize("time_ms", [0, 1234, 5000, 1e9])
+def test_seek_to_time(muxer, convert, stride, time_ms):
+    data = convert(muxer.data) if convert else muxer.data
+    offset = TsParser().seek_to_time(io.BytesIO(data), time_ms)
+    assert offset == pcr_packet_at(muxer, time_ms) * stride
+
+
+@pytest.mark.parametrize("convert, stride", FORMATS)
+def test_seek_drops_partial_pes(muxer, convert, stride):
+    data = convert(muxer.data) if convert else muxer.data
+    stream = io.BytesIO(data)
+    parser = PesCollector()
+    parser.parse(io.BytesIO(data[:len(data) // 2]))
+    # unfinished pes packets left by the first half must not be completed with the data after the seek
+    offset = parser.seek_to_time(stream, 2000)
+    for pes_packets in parser.pes_packets.values():
+        pes_packets.clear()
+    parser.parse(stream)
+
+    seek_packet = offset // stride
+    for pid, pes_packets in muxer.pes_packets.items():
+        expected = [pes_packet for pes_packet, (_, packet_idx, _) in zip(pes_packets, muxer.pes_starts[pid])
+                    if packet_idx >= seek_packet]
+        assert parser.pes_packets[pid] == expected
+    assert parser.continuity_errors == 0
+
+
+@pytest.mark.parametrize("convert, stride", FORMATS)
+def test_index_offsets(tmp_path, muxer, convert, stride):
+    path = tmp_path / "stream.ts"
+    path.write_bytes(convert(muxer.data) if convert else muxer.data)
+    index = TsIndex.build(str(path))
+
+    assert [offset for offset in index.pcr[1].offsets] == [packet_idx * stride for _, packet_idx in muxer.pcr_packets]
+    for time_ms in (0, 1234, 5000, 1e9):
+        assert index.offset_at(time_ms) == pcr_packet_at(muxer, time_ms) * stride
+        with open(path, "rb") as f:
+            assert index.seek(f, time_ms) == f.tell() == index.offset_at(time_ms)
+
+    keyframes = [(pts, packet_idx * stride) for pts, packet_idx, random_access in muxer.pes_starts[0x101]
+                 if random_access]
+    assert index.keyframes(0x101) == keyframes
+    # 500ms after the second keyframe, 25 frames apart
+    assert index.pts_offset_at(0x101, keyframes[1][0] + 500) == keyframes[1][1]
+    assert index.pts_offset_at(0x101, keyframes[1][0] + 500, random_access=False) \
+        == muxer.pes_starts[0x101][25 + 12][1] * stride
+
+
+def test_index_late_idr(tmp_path):
+    # no random access indicator, the IDR slice starts after the first ts packet of the pes packet
+    muxer = make_stream(frames=100, random_access=False, parameter_sets=True)
+    path = tmp_path / "stream.ts"
+    path.write_bytes(muxer.data)
+    index = TsIndex.build(str(path))
+    assert index.keyframes(0x101) == [(pts, packet_idx * TS_PKT_LEN)
+                                      for pts, packet_idx, _ in muxer.pes_starts[0x101][::25]]
+
+
+def test_index_save_load(tmp_path, muxer):
+    path = tmp_path / "stream.ts"
+    path.write_bytes(muxer.data)
+    index = TsIndex.open(str(path))
+    assert (tmp_path / ("stream.ts" + TsIndex.SIDECAR_EXT)).exists()
+    loaded = TsIndex.open(str(path))
+    assert loaded.keyframes(0x101) == index.keyframes(0x101)
+    assert sorted(loaded.pts) == sorted(index.pts) == [0x101, 0x102]
+    for time_ms in range(0, 8000, FRAME_PCR // 27000 * 3):
+        assert loaded.offset_at(time_ms) == index.offset_at(time_ms)
@@ -0,0 +1,86 @@
+import socket
+
+import pytest
+
+from tests.tsgen import PesCollector, TS_PKT_LEN, make_stream, rtp_datagrams
+from tsdemux.udp import UdpTsReceiver
+
+
+def receive(datagrams: list) -> (UdpTsReceiver, PesCollector):
+    """Send datagrams to a receiver bound on the loopback, in order"""
+    parser = PesCollector()
+    receiver = UdpTsReceiver.open(parser, "127.0.0.1", 0, batch_size=8)
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        address = receiver.sock.getsockname()
+        for idx, datagram in enumerate(datagrams):
+            sender.sendto(datagram, address)
+            # keep the socket buffer from overflowing
+            if idx % 16 == 15 or idx == len(datagrams) - 1:
+                while receiver.datagrams <= idx and receiver.receive_batch(1.0):
+                    pass
+    finally:
+        sender.close()
+        receiver.close()
+    parser.flush()
+    return receiver, parser
+
+
+@pytest.fixture(scope="module")
+def muxer():
+    return make_stream(frames=30)
+
+
+def test_raw_ts(muxer):
+    data = muxer.data
+    datagrams = [data[offset:offset + 7 * TS_PKT_LEN] for offset in range(0, len(data), 7 * TS_PKT_LEN)]
+    receiver, parser = receive(datagrams)
+    assert receiver.datagrams == len(datagrams)
+    assert receiver.rtp_datagrams == 0
+    assert parser.pes_packets == muxer.pes_packets
+
+
+def test_rtp(muxer):
+    # sequence numbers wrap during the stream
+    datagrams = rtp_datagrams(muxer.data, seq=0xFFF0)
+    receiver, parser = receive(datagrams)
+    assert receiver.rtp_datagrams == len(datagrams)
+    assert receiver.rtp_lost == 0
+    assert receiver.rtp_out_of_order == 0
+    assert parser.pes_packets == muxer.pes_packets
+
+
+def test_rtp_gaps(muxer):
+    datagrams = rtp_datagrams(muxer.data, seq=0xFFF0)
+    # datagrams 20 and 40 to 42 lost, across the sequence number wrap for the first one
+    received = datagrams[:20] + datagrams[21:40] + datagrams[43:]
+    receiver, parser = receive(received)
+    assert receiver.rtp_datagrams == len(received)
+    assert receiver.rtp_lost == 4
+    assert receiver.rtp_out_of_order == 0
+    assert parser.continuity_errors > 0
+
+
+def test_rtp_late_and_duplicated(muxer):
+    datagrams = rtp_datagrams(muxer.data)
+    # 10 duplicated, 30 arriving after 31
+    received = datagrams[:11] + [datagrams[10]] + datagrams[11:30] + [datagrams[31], datagrams[30]] + datagrams[32:]
+    receiver, parser = receive(received)
+    assert receiver.rtp_out_of_order == 2
+    assert receiver.rtp_lost == 1
+
+    # the duplicate is dropped without damage, the late datagram is dropped as lost
+    reference, reference_parser = receive(datagrams[:30] + datagrams[31:])
+    assert parser.pes_packets == reference_parser.pes_packets
+    assert parser.continuity_errors == reference_parser.continuity_errors
+
+
+def test_rtp_restart(muxer):
+    datagrams = rtp_datagrams(muxer.data, seq=5000)
+    # the sender restarts its sequence numbers halfway
+    restarted = rtp_datagrams(muxer.data, seq=10)
+    half = len(datagrams) // 2
+    receiver, parser = receive(datagrams[:half] + restarted[half:])
+    assert receiver.rtp_out_of_order == 0
+    assert receiver.rtp_lost == 0
+    assert parser.pes_packets == muxer.pes_packets
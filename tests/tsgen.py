@@ -0,0 +1,220 @@
+"""
+Synthetic MPEG-TS and RTP streams for the tests, along with what the demuxer
+is expected to extract from them
+"""
+import random
+import struct
+
+from tsdemux.crc32 import Crc32
+from tsdemux.demux import TsParser
+from tsdemux.es import Es
+from tsdemux.pes import PesReader
+
+TS_PKT_LEN = 188
+STREAM_ID_VIDEO = 0xE0
+STREAM_ID_AUDIO = 0xC0
+# 25 frames per second
+FRAME_PCR = 27000000 // 25
+# pts of a frame, in 90kHz ticks, ahead of its pcr
+PTS_DELAY = 9000
+
+AUD = b'\x00\x00\x00\x01\x09\xf0'
+SPS = b'\x00\x00\x00\x01\x67\x64\x00\x1f\xac\xd9\x40\x50\x05\xbb\x01\x10'
+PPS = b'\x00\x00\x00\x01\x68\xeb\xe3\xcb\x22\xc0'
+NAL_IDR = 0x65
+NAL_SLICE = 0x41
+
+
+def section(table_id: int, ext_id: int, payload: bytes, version: int = 0) -> bytes:
+    length = 5 + len(payload) + 4
+    data = struct.pack(">BHHBBB", table_id, 0xB000 | length, ext_id, 0xC1 | (version << 1), 0, 0) + payload
+    return data + struct.pack(">I", Crc32.compute(data))
+
+
+def pat_section(programs: dict, version: int = 0) -> bytes:
+    """:param programs: program_id => pmt pid"""
+    return section(0x00, 1, b"".join(struct.pack(">HH", program_id, 0xE000 | pid)
+                                     for program_id, pid in sorted(programs.items())), version)
+
+
+def pmt_section(program_id: int, pcr_pid: int, streams: list, version: int = 0) -> bytes:
+    """:param streams: (stream_type, pid) of the elementary streams"""
+    payload = struct.pack(">HH", 0xE000 | pcr_pid, 0xF000)
+    for stream_type, pid in streams:
+        payload += struct.pack(">BHH", stream_type, 0xE000 | pid, 0xF000)
+    return section(0x02, program_id, payload, version)
+
+
+def encode_pts(pts: int) -> bytes:
+    return bytes([0x21 | ((pts >> 29) & 0x0E), (pts >> 22) & 0xFF, ((pts >> 14) & 0xFE) | 1,
+                  (pts >> 7) & 0xFF, ((pts << 1) & 0xFE) | 1])
+
+
+class TsMuxer:
+    """
+    Write 188 bytes packets, recording the pes packets, the pcr and the pes
+    starts written, with the index of the packets carrying them
+    """
+
+    def __init__(self):
+        self.out = bytearray()
+        self.continuity_counters = {}
+        # pid => [(pts in ms, payload)]
+        self.pes_packets = {}
+        # pid => [(pts in ms, packet index, random access)]
+        self.pes_starts = {}
+        # (pcr, packet index)
+        self.pcr_packets = []
+
+    @property
+    def data(self) -> bytes:
+        return bytes(self.out)
+
+    @property
+    def packet_count(self) -> int:
+        return len(self.out) // TS_PKT_LEN
+
+    def packet(self, pid: int, payload: bytes, pusi: bool = False, pcr: int = None,
+               random_access: bool = False) -> int:
+        """
+        Write a packet with as much of payload as fits, stuffed through the adaptation field
+        :returns number of payload bytes written
+        """
+        body = b""
+        if pcr is not None or random_access:
+            body = bytes([(0x10 if pcr is not None else 0) | (0x40 if random_access else 0)])
+            if pcr is not None:
+                base, ext = divmod(pcr, 300)
+                body += struct.pack(">IH", (base >> 1) & 0xFFFFFFFF, ((base & 1) << 15) | 0x7E00 | ext)
+                self.pcr_packets.append((pcr, self.packet_count))
+
+        if not body and len(payload) >= 184:
+            afield = b""
+            chunk = payload[:184]
+            control = 0x10
+        else:
+            room = 183 - len(body)
+            chunk = payload[:room]
+            stuffing = room - len(chunk)
+            if stuffing:
+                body = (body or b"\x00") + b"\xff" * (stuffing - (0 if body else 1))
+            afield = bytes([len(body)]) + body
+            control = 0x30
+
+        cc = self.continuity_counters.get(pid, 0)
+        self.continuity_counters[pid] = (cc + 1) & 0xF
+        self.out += struct.pack(">BHB", 0x47, (0x4000 if pusi else 0) | pid, control | cc) + afield + chunk
+        return len(chunk)
+
+    def psi(self, pid: int, data: bytes):
+        data = b"\x00" + data
+        for start in range(0, len(data), 184):
+            chunk = data[start:start + 184]
+            self.packet(pid, chunk + b"\xff" * (184 - len(chunk)), pusi=start == 0)
+
+    def pes(self, pid: int, stream_id: int, pts: int, payload: bytes, pcr: int = None,
+            random_access: bool = False, bounded: bool = True):
+        """:param pts: 90kHz ticks"""
+        header = bytes([0x80, 0x80, 5]) + encode_pts(pts)
+        packet_len = len(header) + len(payload) if bounded else 0
+        self.pes_packets.setdefault(pid, []).append((pts / 90, payload))
+        self.pes_starts.setdefault(pid, []).append((pts / 90, self.packet_count, random_access))
+
+        data = b"\x00\x00\x01" + struct.pack(">BH", stream_id, packet_len) + header + payload
+        first = True
+        while data:
+            written = self.packet(pid, data, pusi=first, pcr=pcr if first else None,
+                                  random_access=random_access and first)
+            data = data[written:]
+            first = False
+
+    def null(self):
+        self.out += struct.pack(">BHB", 0x47, 0x1FFF, 0x10) + b"\xff" * 184
+
+
+def random_bytes(rnd: random.Random, size: int) -> bytes:
+    return rnd.getrandbits(8 * size).to_bytes(size, "little")
+
+
+def make_stream(frames: int = 100, programs: int = 1, seed: int = 0, keyframe_interval: int = 25,
+                random_access: bool = True, bounded_video: bool = True, parameter_sets: bool = False) -> TsMuxer:
+    """
+    Programs with an H264 video and an AAC audio stream, the pcr is carried by the video pid.
+    Program n (from 1) uses pid 0x100 * n for its pmt, + 1 for the video, + 2 for the audio
+    :param random_access: set the random access indicator on keyframes
+    :param bounded_video: video pes packets have a size, unbounded ones end at the next pes packet
+    :param parameter_sets: keyframes start with an access unit delimiter, sps, pps and a large sei,
+                           pushing the IDR slice past the first ts packet
+    """
+    rnd = random.Random(seed)
+    muxer = TsMuxer()
+    pmt_pids = {program_id: 0x100 * program_id for program_id in range(1, programs + 1)}
+    pat = pat_section(pmt_pids)
+    pmts = {pid: pmt_section(program_id, pid + 1, [(Es.STREAM_TYPE_H264, pid + 1), (0x0F, pid + 2)])
+            for program_id, pid in pmt_pids.items()}
+
+    for frame in range(frames):
+        pcr = frame * FRAME_PCR
+        pts = pcr // 300 + PTS_DELAY
+        if frame % 10 == 0:
+            muxer.psi(0, pat)
+            for pid, pmt in pmts.items():
+                muxer.psi(pid, pmt)
+        for pid in pmt_pids.values():
+            keyframe = frame % keyframe_interval == 0
+            video = b'\x00\x00\x00\x01' + bytes([NAL_IDR if keyframe else NAL_SLICE]) \
+                + random_bytes(rnd, rnd.randrange(100, 3000))
+            if keyframe and parameter_sets:
+                sei = b'\x00\x00\x01\x06' + bytes(rnd.randrange(1, 256) for _ in range(300))
+                video = AUD + SPS + PPS + sei + video
+            muxer.pes(pid + 1, STREAM_ID_VIDEO, pts, video, pcr=pcr, random_access=keyframe and random_access,
+                      bounded=bounded_video)
+            muxer.pes(pid + 2, STREAM_ID_AUDIO, pts, random_bytes(rnd, rnd.randrange(100, 400)))
+        if frame % 7 == 0:
+            muxer.null()
+    return muxer
+
+
+def m2ts(data: bytes) -> bytes:
+    """BDAV packets: 4 bytes arrival timestamp before each packet"""
+    return b"".join(struct.pack(">I", (idx * 1000) & 0x3FFFFFFF) + data[offset:offset + TS_PKT_LEN]
+                    for idx, offset in enumerate(range(0, len(data), TS_PKT_LEN)))
+
+
+def reed_solomon(data: bytes) -> bytes:
+    """204 bytes packets: 16 bytes parity trailer after each packet"""
+    return b"".join(data[offset:offset + TS_PKT_LEN] + b"\x00" * 16 for offset in range(0, len(data), TS_PKT_LEN))
+
+
+def rtp_datagrams(data: bytes, packets_per_datagram: int = 7, seq: int = 0, ssrc: int = 1) -> list:
+    """:returns RTP (MP2T payload type) datagrams carrying data, sequence numbers start at seq"""
+    datagram_len = packets_per_datagram * TS_PKT_LEN
+    return [struct.pack(">BBHII", 0x80, 33, (seq + idx) & 0xFFFF, idx * 3600, ssrc) + data[offset:offset + datagram_len]
+            for idx, offset in enumerate(range(0, len(data), datagram_len))]
+
+
+class CollectingPesReader(PesReader):
+
+    def __init__(self, pid: int, es: Es, pes_packets: list, keyframes_only: bool = False):
+        super().__init__(pid, es, keyframes_only=keyframes_only)
+        self.pes_packets = pes_packets
+
+    def on_pes_packet_complete(self):
+        if self.sections is None:
+            return
+        self.pes_packets.append((self.pts, b"".join(bytes(section.data) for section in self.sections)))
+
+
+class PesCollector(TsParser):
+    """Parser keeping the pts (ms) and the payload of every pes packet, by pid"""
+
+    def __init__(self, keyframes_only: bool = False, **kwargs):
+        super().__init__(**kwargs)
+        self.keyframes_only = keyframes_only
+        # pid => [(pts in ms, payload)]
+        self.pes_packets = {}
+
+    def on_stream_added(self, program_id: int, pid: int, es: Es):
+        self.pid_handlers[pid] = CollectingPesReader(
+            pid, es, self.pes_packets.setdefault(pid, []),
+            keyframes_only=self.keyframes_only and es.stream_type == Es.STREAM_TYPE_H264)
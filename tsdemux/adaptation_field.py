@@ -0,0 +1,165 @@
+from typing import Optional
+
+
+class AdaptationField:
+    """
+    Adaptation field of a ts packet, fields are only decoded when accessed.
+    data starts with the adaptation_field_length byte, it is only valid
+    during the on_adaptation_field callback.
+    """
+
+    __slots__ = ("data", "length", "flags")
+
+    FLAG_DISCONTINUITY = 0x80
+    FLAG_RANDOM_ACCESS = 0x40
+    FLAG_ES_PRIORITY = 0x20
+    FLAG_PCR = 0x10
+    FLAG_OPCR = 0x08
+    FLAG_SPLICING_POINT = 0x04
+    FLAG_PRIVATE_DATA = 0x02
+    FLAG_EXTENSION = 0x01
+
+    # adaptation field extension flags
+    EXT_FLAG_LTW = 0x80
+    EXT_FLAG_PIECEWISE_RATE = 0x40
+    EXT_FLAG_SEAMLESS_SPLICE = 0x20
+
+    def __init__(self, data):
+        self.data = data
+        self.length = data[0]
+        self.flags = data[1] if self.length else 0
+
+    @property
+    def discontinuity(self) -> bool:
+        return (self.flags & self.FLAG_DISCONTINUITY) != 0
+
+    @property
+    def random_access(self) -> bool:
+        return (self.flags & self.FLAG_RANDOM_ACCESS) != 0
+
+    @property
+    def es_priority(self) -> bool:
+        return (self.flags & self.FLAG_ES_PRIORITY) != 0
+
+    @property
+    def has_pcr(self) -> bool:
+        return (self.flags & self.FLAG_PCR) != 0 and self.length >= 7
+
+    def field_offset(self, flag: int) -> int:
+        """
+        :returns offset in data of the optional field of flag, -1 if absent or truncated
+        """
+        flags = self.flags
+        if not flags & flag:
+            return -1
+        offset = 2
+        if flag != self.FLAG_PCR and flags & self.FLAG_PCR:
+            offset += 6
+        if flag < self.FLAG_OPCR and flags & self.FLAG_OPCR:
+            offset += 6
+        if flag < self.FLAG_SPLICING_POINT and flags & self.FLAG_SPLICING_POINT:
+            offset += 1
+        if flag < self.FLAG_PRIVATE_DATA and flags & self.FLAG_PRIVATE_DATA:
+            if offset > self.length:
+                return -1
+            offset += 1 + self.data[offset]
+        if offset > self.length:
+            return -1
+        return offset
+
+    def read_clock(self, offset: int) -> (int, int):
+        """:returns 33 bits base (90kHz) and 9 bits extension of the clock at offset"""
+        data = self.data
+        base = (data[offset] << 25) | (data[offset + 1] << 17) | (data[offset + 2] << 9) \
+            | (data[offset + 3] << 1) | (data[offset + 4] >> 7)
+        ext = ((data[offset + 4] & 0x1) << 8) | data[offset + 5]
+        return base, ext
+
+    @property
+    def pcr_base(self) -> int:
+        """33 bits pcr base (90kHz), -1 if absent"""
+        if not self.has_pcr:
+            return -1
+        return self.read_clock(2)[0]
+
+    @property
+    def pcr(self) -> int:
+        """full precision pcr (27MHz), -1 if absent"""
+        if not self.has_pcr:
+            return -1
+        base, ext = self.read_clock(2)
+        return base * 300 + ext
+
+    @property
+    def opcr(self) -> int:
+        """full precision original pcr (27MHz), -1 if absent"""
+        offset = self.field_offset(self.FLAG_OPCR)
+        if offset < 0 or offset + 6 > self.length + 1:
+            return -1
+        base, ext = self.read_clock(offset)
+        return base * 300 + ext
+
+    @property
+    def splice_countdown(self) -> Optional[int]:
+        """signed number of packets until the splicing point, None if absent"""
+        offset = self.field_offset(self.FLAG_SPLICING_POINT)
+        if offset < 0 or offset >= self.length + 1:
+            return None
+        countdown = self.data[offset]
+        return countdown - 0x100 if countdown & 0x80 else countdown
+
+    @property
+    def private_data(self) -> Optional[bytes]:
+        offset = self.field_offset(self.FLAG_PRIVATE_DATA)
+        if offset < 0 or offset >= self.length + 1:
+            return None
+        private_data_len = self.data[offset]
+        return bytes(self.data[offset + 1:min(offset + 1 + private_data_len, self.length + 1)])
+
+    @property
+    def extension(self) -> Optional[bytes]:
+        """adaptation field extension, without its length byte"""
+        offset = self.field_offset(self.FLAG_EXTENSION)
+        if offset < 0 or offset >= self.length + 1:
+            return None
+        extension_len = self.data[offset]
+        return bytes(self.data[offset + 1:min(offset + 1 + extension_len, self.length + 1)])
+
+    def extension_field(self, flag: int, size: int) -> Optional[bytes]:
+        extension = self.extension
+        if not extension or not extension[0] & flag:
+            return None
+        offset = 1
+        if flag != self.EXT_FLAG_LTW and extension[0] & self.EXT_FLAG_LTW:
+            offset += 2
+        if flag == self.EXT_FLAG_SEAMLESS_SPLICE and extension[0] & self.EXT_FLAG_PIECEWISE_RATE:
+            offset += 3
+        if offset + size > len(extension):
+            return None
+        return extension[offset:offset + size]
+
+    @property
+    def ltw_offset(self) -> int:
+        """legal time window offset, -1 if absent or not valid"""
+        field = self.extension_field(self.EXT_FLAG_LTW, 2)
+        if field is None or not field[0] & 0x80:
+            return -1
+        return ((field[0] & 0x7F) << 8) | field[1]
+
+    @property
+    def piecewise_rate(self) -> int:
+        """piecewise rate (50 bytes/s units), -1 if absent"""
+        field = self.extension_field(self.EXT_FLAG_PIECEWISE_RATE, 3)
+        if field is None:
+            return -1
+        return ((field[0] & 0x3F) << 16) | (field[1] << 8) | field[2]
+
+    @property
+    def seamless_splice(self) -> Optional[tuple]:
+        """(splice_type, dts_next_au 90kHz), None if absent"""
+        field = self.extension_field(self.EXT_FLAG_SEAMLESS_SPLICE, 5)
+        if field is None:
+            return None
+        dts_next_au = (((field[0] & 0x0E) << 29) | (field[1] << 22) | ((field[2] >> 1) << 15)
+                       | (field[3] << 7) | (field[4] >> 1))
+        return field[0] >> 4, dts_next_au
@@ -0,0 +1,102 @@
+import asyncio
+from typing import Optional, Set
+
+from tsdemux.demux import TsParser
+from tsdemux.es import Es
+from tsdemux.pes import PesPacket, PesReader
+
+
+class QueuedPesReader(PesReader):
+    """Push every complete pes packet to an asyncio queue"""
+
+    def __init__(self, pid: int, es: Es, program_id: int, queue: asyncio.Queue):
+        super().__init__(pid, es)
+        self.program_id = program_id
+        self.queue = queue
+
+    def on_pes_packet_complete(self):
+        if self.sections is None:
+            return
+
+        # section buffers are reused, copy them
+        if len(self.sections) == 1:
+            data = bytes(self.sections[0].data)
+        else:
+            data = b"".join(section.data for section in self.sections)
+        scrambled = any(section.scrambling != 0 for section in self.sections)
+        self.queue.put_nowait(PesPacket(self.program_id, self.pid, self.es, self.pts, self.dts, scrambled, data))
+
+
+class AsyncTsDemuxer(TsParser):
+    """
+    asyncio front end: data is pushed with feed() from a StreamReader (run) or a
+    datagram protocol, psi and pes handlers run inline in the event loop and
+    complete pes packets are consumed with: async for pes_packet in demuxer
+    """
+
+    # size of the reads from the stream reader
+    READ_SIZE = 64 * 1024
+
+    def __init__(self, media_types: Optional[Set[int]] = None, verbose=False, drop_unhandled=False):
+        """
+        :param media_types: media types (Es.MEDIA_TYPE_*) of the streams to demux, all if None
+        """
+        super().__init__(verbose=verbose, drop_unhandled=drop_unhandled)
+        self.media_types = media_types
+        self.queue = asyncio.Queue()
+        self.closed = False
+
+    def on_stream_added(self, program_id: int, pid: int, es: Es):
+        if self.media_types is not None and es.media_type not in self.media_types:
+            return
+        self.pid_handlers[pid] = QueuedPesReader(pid, es, program_id, self.queue)
+
+    def on_stream_removed(self, program_id: int, pid: int, es: Es):
+        if isinstance(self.pid_handlers.get(pid), QueuedPesReader):
+            del self.pid_handlers[pid]
+
+    def close(self):
+        """End of input: parse what is left and stop the iteration once the queue is empty"""
+        if self.closed:
+            return
+        self.closed = True
+        self.flush()
+        self.queue.put_nowait(None)
+
+    async def run(self, reader: asyncio.StreamReader):
+        """Demux the stream until eof"""
+        try:
+            while True:
+                chunk = await reader.read(self.READ_SIZE)
+                if not chunk:
+                    break
+                self.feed(chunk)
+        finally:
+            self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> PesPacket:
+        pes_packet = await self.queue.get()
+        if pes_packet is None:
+            # keep the end marker for other consumers
+            self.queue.put_nowait(None)
+            raise StopAsyncIteration
+        return pes_packet
+
+
+class TsDatagramProtocol(asyncio.DatagramProtocol):
+    """Feed each received datagram to a demuxer, ex: raw ts over udp"""
+
+    def __init__(self, demuxer: AsyncTsDemuxer):
+        self.demuxer = demuxer
+
+    def datagram_received(self, data: bytes, addr):
+        self.demuxer.feed(data)
+
+    def error_received(self, exc: Exception):
+        self.demuxer.warning("datagram error: %s", exc)
+
+    def connection_lost(self, exc: Optional[Exception]):
+        self.demuxer.close()
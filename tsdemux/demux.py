@@ -1,12 +1,21 @@
 #!/usr/bin/env python3
 
-from typing import Dict
+import mmap
+import os
+import time
+from itertools import repeat
+from typing import Optional
 
+from tsdemux.adaptation_field import AdaptationField
 from tsdemux.es import Es
 from tsdemux.logger import LogEnabled
+from tsdemux.packet import TsPacket
 from tsdemux.pat import PatTableReader
+from tsdemux.pes import PesReader
+from tsdemux.pid_table import PidTable
 from tsdemux.pmt import PmtTableReader
-from tsdemux.reader import TsReader
+from tsdemux.read_ahead import ReadAheadReader
+from tsdemux.vectorized import PacketHeaders
 
 
 class TsParser(LogEnabled):
@@ -14,23 +23,86 @@ class TsParser(LogEnabled):
     TS_PKT_LEN = 188
     TS_SYNC_BYTE = 0x47
     PAT_PID = 0x0000
-
-    def __init__(self, verbose=False):
+    # default size of the blocks read from the input stream (~1MB)
+    BLOCK_SIZE = TS_PKT_LEN * 5577
+    # number of consecutive sync bytes, one packet apart, required to lock
+    SYNC_LOCK_PACKETS = 5
+    # number of consecutive packets without sync byte before the lock is lost
+    SYNC_LOSS_PACKETS = 3
+    # size of the windows searched for sync bytes
+    SYNC_WINDOW = 64 * 1024
+    # BDAV (M2TS) packets: 4 bytes timecode prefix
+    M2TS_PKT_LEN = 192
+    # DVB ASI packets with 16 bytes Reed-Solomon trailer
+    RS_PKT_LEN = 204
+    # packet strides tried during sync acquisition, with the size of the prefix before the sync byte
+    PKT_FORMATS = ((TS_PKT_LEN, 0), (M2TS_PKT_LEN, 4), (RS_PKT_LEN, 0))
+    PKT_PREFIX = dict(PKT_FORMATS)
+    # smallest buffer used by parse(), holds enough packets of the largest stride to lock
+    MIN_BLOCK_SIZE = -(-(SYNC_LOCK_PACKETS + 1) * RS_PKT_LEN // TS_PKT_LEN) * TS_PKT_LEN
+    # number of packets read at once while looking for a pcr during seek_to_time
+    SEEK_PROBE_PACKETS = 64
+    # max size of the data read from the start of the stream to find the psi before seeking
+    SEEK_PSI_SIZE = BLOCK_SIZE * 4
+    # 33 bits pcr base rollover
+    PCR_WRAP = 1 << 33
+    # size of the blocks read by probe(), small to stop as soon as the psi is complete
+    PROBE_BLOCK_SIZE = TS_PKT_LEN * 348
+    # default byte budget of probe()
+    PROBE_MAX_BYTES = BLOCK_SIZE * 8
+    # format version of snapshot()
+    SNAPSHOT_VERSION = 1
+
+    def __init__(self, verbose=False, drop_unhandled=False):
+        """
+        :param drop_unhandled: reject packets of pids without handler right after
+                               pid extraction (no continuity check)
+        """
         super().__init__(verbose=verbose)
         self.continuity_counters = {}
         self.pkt_count = 0
+        # absolute offset of the first byte not consumed yet
+        self.stream_offset = 0
+        # absolute offset of the current packet, including the M2TS prefix
+        self.pkt_offset = 0
         self.program_pids = {}
         self.pcr_ms = 0
         self.pmts = {}
         self.corrupted_packets = 0
-        self.pid_handlers: Dict[int, TsReader] = {
-            self.PAT_PID: PatTableReader(self.PAT_PID, self.on_program_added, self.on_program_removed)
-        }
+        self.continuity_errors = 0
+        self.sync_locked = False
+        self.sync_misses = 0
+        self.sync_skipped = 0
+        self.skipped_bytes = 0
+        self.pkt_stride = self.TS_PKT_LEN
+        self.pkt_prefix = 0
+        # arrival timestamp of the current packet (27MHz), M2TS only
+        self.arrival_timestamp = -1
+        # incomplete data left by the last feed() call
+        self.feed_pending = bytearray()
+        self.pid_handlers = PidTable(PidTable.FLAG_DROP if drop_unhandled else PidTable.FLAG_CC_CHECK)
+        self.pid_handlers[self.PAT_PID] = PatTableReader(self.PAT_PID, self.on_program_added, self.on_program_removed)
         self.programs_pcr_pid = {}
+        # reverse index of programs_pcr_pid: pcr pid => programs
+        self.pcr_pid_programs = {}
         self.programs_pcr = {}
 
+    def set_pcr_pid(self, program_id: int, pid: Optional[int]):
+        prev_pid = self.programs_pcr_pid.pop(program_id, None)
+        if prev_pid is not None:
+            programs = tuple(p for p in self.pcr_pid_programs.get(prev_pid, ()) if p != program_id)
+            if programs:
+                self.pcr_pid_programs[prev_pid] = programs
+            else:
+                self.pcr_pid_programs.pop(prev_pid, None)
+                self.pid_handlers.set_pcr(prev_pid, False)
+        if pid is not None:
+            self.programs_pcr_pid[program_id] = pid
+            self.pcr_pid_programs[pid] = self.pcr_pid_programs.get(pid, ()) + (program_id,)
+            self.pid_handlers.set_pcr(pid, True)
+
     def on_pcr_pid_changed(self, program_id: int, new_pid: int):
-        self.programs_pcr_pid[program_id] = new_pid
+        self.set_pcr_pid(program_id, new_pid)
         self.programs_pcr[program_id] = 0
 
     def on_stream_added(self, program_id: int, pid: int, es: Es):
@@ -39,23 +111,166 @@ class TsParser(LogEnabled):
     def on_stream_removed(self, program_id: int, pid: int, es: Es):
         pass
 
+    def on_stream_updated(self, program_id: int, pid: int, prev_es: Es, es: Es):
+        """
+        Called when a new pmt version changes a stream, its pes reader is kept along
+        with its reassembly state if it accepts the new es, otherwise the stream
+        is removed and added again
+        """
+        handler = self.pid_handlers.get(pid)
+        if isinstance(handler, PesReader) and handler.update_es(es):
+            return
+        self.on_stream_removed(program_id, pid, prev_es)
+        self.on_stream_added(program_id, pid, es)
+
     def on_program_added(self, program_id, pid):
         self.pid_handlers[pid] = PmtTableReader(pid, program_id,
                                                 self.on_pcr_pid_changed,
                                                 self.on_stream_added,
-                                                self.on_stream_removed)
+                                                self.on_stream_removed,
+                                                self.on_stream_updated)
 
     def on_program_removed(self, program_id, pid):
         if pid in self.pid_handlers:
             del self.pid_handlers[pid]
         if program_id in self.programs_pcr:
             del self.programs_pcr[program_id]
+        self.set_pcr_pid(program_id, None)
+
+    def psi_complete(self) -> bool:
+        """:returns True once the pat and the pmts of all its programs are complete"""
+        pat = self.pid_handlers[self.PAT_PID]
+        if not pat.table_complete:
+            return False
+        for pmt_pid in pat.programs.values():
+            pmt = self.pid_handlers.get(pmt_pid)
+            if not isinstance(pmt, PmtTableReader) or not pmt.table_complete:
+                return False
+        return True
+
+    def psi_summary(self) -> dict:
+        """:returns programs and streams found so far in the pat and pmts"""
+        pat = self.pid_handlers[self.PAT_PID]
+        programs = []
+        for program_id, pmt_pid in sorted(pat.programs.items()):
+            pmt = self.pid_handlers.get(pmt_pid)
+            if not isinstance(pmt, PmtTableReader):
+                pmt = None
+            programs.append({
+                "program": program_id,
+                "pmt_pid": pmt_pid,
+                "complete": pmt is not None and pmt.table_complete,
+                "pcr_pid": pmt.pcr_pid if pmt is not None else -1,
+                "streams": [{
+                    "pid": pid,
+                    "stream_type": es.stream_type,
+                    "media_type": es.media_type,
+                    "name": es.name,
+                    "langs": list(es.langs),
+                    "descriptors": sorted(es.descriptors),
+                } for pid, es in sorted(pmt.streams.items())] if pmt is not None else [],
+            })
+        return {
+            "complete": self.psi_complete(),
+            "pkt_stride": self.pkt_stride if self.sync_locked else 0,
+            "programs": programs,
+        }
+
+    def probe(self, stream, max_bytes: int = PROBE_MAX_BYTES, max_time: Optional[float] = None) -> dict:
+        """
+        Only read the stream until the pat and all the pmts are complete, or until
+        max_bytes are read or max_time seconds elapsed. Use drop_unhandled=True
+        to skip everything but the psi.
+        :returns a summary of the programs and streams, see psi_summary()
+        """
+        deadline = None if max_time is None else time.monotonic() + max_time
+        buf = bytearray(self.PROBE_BLOCK_SIZE)
+        view = memoryview(buf)
+        readinto = getattr(stream, "readinto", None)
+        read_total = 0
+
+        while not self.psi_complete() and read_total < max_bytes:
+            if deadline is not None and time.monotonic() > deadline:
+                self.warning("probe: time budget exceeded after %d bytes", read_total)
+                break
+            size = min(len(buf), max_bytes - read_total)
+            if readinto is not None:
+                read_len = readinto(view[:size])
+            else:
+                chunk = stream.read(size)
+                read_len = len(chunk)
+                view[:read_len] = chunk
+            if not read_len:
+                break
+            read_total += read_len
+            self.feed(view[:read_len])
+
+        view.release()
+        summary = self.psi_summary()
+        summary["bytes"] = read_total
+        return summary
+
+    def snapshot(self) -> dict:
+        """
+        :returns the psi state (raw pat/pmt sections), continuity counters and pcr state,
+                 made of builtin types only so it can be pickled, see restore()
+        """
+        tables = {self.PAT_PID: self.pid_handlers[self.PAT_PID]}
+        tables.update((pid, reader) for pid, reader in self.pid_handlers.items() if isinstance(reader, PmtTableReader))
+        return {
+            "version": self.SNAPSHOT_VERSION,
+            "pkt_stride": self.pkt_stride,
+            "pkt_prefix": self.pkt_prefix,
+            "sync_locked": self.sync_locked,
+            "tables": {pid: [section for _, section in sorted(reader.raw_sections.items())]
+                       for pid, reader in tables.items()},
+            "continuity_counters": dict(self.continuity_counters),
+            "programs_pcr": dict(self.programs_pcr),
+        }
+
+    def restore(self, state: dict):
+        """
+        Warm start from the snapshot of a parser which processed the previous part of the
+        stream (ex: previous segment): the pat and pmt sections are parsed again so programs
+        and streams are added through the usual callbacks before the first packet is parsed.
+        """
+        if state.get("version") != self.SNAPSHOT_VERSION:
+            raise ValueError(f"unsupported snapshot version {state.get('version')}")
+
+        tables = state["tables"]
+        self.pid_handlers[self.PAT_PID].replay(tables.get(self.PAT_PID, []))
+        for pid, sections in tables.items():
+            reader = self.pid_handlers.get(pid)
+            if pid != self.PAT_PID and isinstance(reader, PmtTableReader):
+                reader.replay(sections)
+
+        self.continuity_counters.update(state["continuity_counters"])
+        for program_id, pcr in state["programs_pcr"].items():
+            if program_id in self.programs_pcr:
+                self.programs_pcr[program_id] = pcr
+        self.pkt_stride = state["pkt_stride"]
+        self.pkt_prefix = state["pkt_prefix"]
+        self.sync_locked = state["sync_locked"]
+
+    def on_adaptation_field(self, pid: int, afield: AdaptationField):
+        """
+        Called for each adaptation field decoded: pids carrying a pcr or flagged with
+        PidTable.FLAG_AFIELD. afield is only valid during the call.
+        """
+        pass
+
+    def on_packet_headers(self, data, headers: PacketHeaders, discontinuities: set):
+        """
+        Called by parse_packets_vectorized with the decoded headers of a block of packets
+        in sync, before they are processed one by one. data holds headers.count packets
+        starting at stream_offset, discontinuities the indices of the packets failing the
+        continuity check.
+        """
+        pass
 
     def decode_adaptation_field(self, pid, data):
-        offset = 0
         data_len = len(data)
-        adaptation_field_len = data[offset] & 0xFF
-        offset += 1
+        adaptation_field_len = data[0]
         if adaptation_field_len > data_len - 1:
             self.warning(f"adaptation field len truncated {adaptation_field_len} vs {data_len} (pid: {pid})")
             return
@@ -63,40 +278,58 @@ class TsParser(LogEnabled):
         if adaptation_field_len == 0:
             return
 
-        flags = data[offset] & 0xFF
-        offset += 1
-
-        if flags & 0x80:
-            self.verbose("discontinuity indicator")
-        if flags & 0x40:
-            self.verbose("random_access_indicator")
-        if flags & 0x20:
-            self.verbose("es_priority_indicator")
-        pcr_present = flags & 0x10
-        if pcr_present:
-            pcr = (((data[offset] & 0xFF) << 25) |
-                   ((data[offset + 1] & 0xFF) << 17) |
-                   ((data[offset + 2] & 0xFF) << 9) |
-                   ((data[offset + 3] & 0xFF) << 1) |
-                   (((data[offset + 4] & 0xFF) >> 7) & 0x1)) / 90
-            for program_id, pcr_pid in self.programs_pcr_pid.items():
-                if pcr_pid == pid:
+        afield = AdaptationField(data)
+        verbose = self.verbose_debug
+        if verbose:
+            if afield.discontinuity:
+                self.verbose("discontinuity indicator")
+            if afield.random_access:
+                self.verbose("random_access_indicator")
+            if afield.es_priority:
+                self.verbose("es_priority_indicator")
+        if afield.has_pcr:
+            programs = self.pcr_pid_programs.get(pid)
+            if programs:
+                pcr = afield.pcr_base / 90
+                for program_id in programs:
                     self.programs_pcr[program_id] = pcr
-                    self.verbose(f"Program {program_id} pcr: {pcr}")
+                    if verbose:
+                        self.verbose("Program %d pcr: %s", program_id, pcr)
 
-    def parse_pkt(self, data):
-        offset = 1
+        self.on_adaptation_field(pid, afield)
 
-        # read header
-        transport_error_indicator = (data[offset] & (1 << 7)) != 0
-        pusi = (data[offset] & (1 << 6)) != 0
-        pid = ((data[offset] << 8) | (data[offset + 1] & 0xFF)) & 0x1FFF
-        scrambled = (data[offset + 2] >> 6) & 0x3
-        afield_ctrl = (data[offset + 2] >> 4) & 0x3
-        continuity_counter = data[offset + 2] & 0xF
-        offset += 3
+    def check_continuity(self, pid: int, continuity_counter: int) -> bool:
+        """
+        :returns True if a discontinuity is detected
+        """
+        if pid not in self.continuity_counters:
+            self.continuity_counters[pid] = continuity_counter
+            return False
 
-        discontinuity = False
+        if self.continuity_counters[pid] == 15:
+            self.continuity_counters[pid] = 0
+        else:
+            self.continuity_counters[pid] += 1
+
+        if self.continuity_counters[pid] != continuity_counter:
+            self.warning("continuity check failed for PID 0x%02x (%02d vd %02d)" % (
+                pid, continuity_counter, self.continuity_counters[pid]))
+            self.continuity_counters[pid] = continuity_counter
+            self.continuity_errors += 1
+            return True
+
+        return False
+
+    def parse_pkt(self, data):
+        # read header
+        pid, ctrl = TsPacket.HEADER.unpack_from(data)
+        transport_error_indicator = pid & 0x8000
+        pusi = (pid & 0x4000) != 0
+        pid &= 0x1FFF
+        scrambled = ctrl >> 6
+        afield_ctrl = (ctrl >> 4) & 0x3
+        continuity_counter = ctrl & 0xF
+        offset = 4
 
         if pid == 0x1FFF:
             # skip padding packet
@@ -108,69 +341,539 @@ class TsParser(LogEnabled):
             self.warning("transport_error_indicator")
             return
 
-        self.verbose("TS PKT [%06d|pid:0x%04x%s]" % (self.pkt_count, pid, pusi and "|PUSI" or ""))
+        verbose = self.verbose_debug
+        if verbose:
+            self.verbose("TS PKT [%06d|pid:0x%04x%s]", self.pkt_count, pid, pusi and "|PUSI" or "")
+
+        flags = self.pid_handlers.flags[pid]
+        decode_afield = flags & (PidTable.FLAG_PCR | PidTable.FLAG_AFIELD) or verbose
 
         # check if payload is present
         if (afield_ctrl & 0x1) == 0:
             # no payload is present
-            self.decode_adaptation_field(pid, data[offset:])
+            if decode_afield:
+                self.decode_adaptation_field(pid, data[offset:])
             return
 
-        if pid not in self.continuity_counters:
-            self.continuity_counters[pid] = continuity_counter
-        else:
-            if self.continuity_counters[pid] == 15:
-                self.continuity_counters[pid] = 0
-            else:
-                self.continuity_counters[pid] += 1
-
-            if self.continuity_counters[pid] != continuity_counter:
-                self.warning("continuity check failed for PID 0x%02x (%02d vd %02d)" % (
-                    pid, continuity_counter, self.continuity_counters[pid]))
-                discontinuity = True
-                self.continuity_counters[pid] = continuity_counter
+        discontinuity = False
+        random_access = False
+        if flags & PidTable.FLAG_CC_CHECK:
+            discontinuity = self.check_continuity(pid, continuity_counter)
 
         # skip adaptation field if present
         if afield_ctrl & 0x2 != 0:
             afield_len = 0xFF & data[offset]
             offset += 1
-            self.verbose(f"afield_len: {afield_len}")
+            if verbose:
+                self.verbose("afield_len: %d", afield_len)
             if afield_len > 183 or (afield_len == 183 and afield_ctrl != 0x2):
                 self.error(f"invalid adaptation field length: {afield_len} @{self.pkt_count}")
                 self.corrupted_packets += 1
                 return
+            random_access = afield_len > 0 and (data[offset] & 0x40) != 0
 
-            self.decode_adaptation_field(pid, data[offset-1:offset+afield_len+1])
+            if decode_afield:
+                self.decode_adaptation_field(pid, data[offset-1:offset+afield_len+1])
 
             # skip adaptation field
             offset += afield_len
 
-        return pid, pusi, discontinuity, scrambled, data[offset:]
+        return TsPacket(pid, pusi, scrambled, continuity_counter, discontinuity, random_access, data[offset:])
+
+    def match_sync(self, window: bytes, pos: int, eof: bool) -> int:
+        """
+        Check if the sync byte at window[pos] is followed by SYNC_LOCK_PACKETS - 1
+        sync bytes at one of the supported packet strides. At eof, fewer packets
+        are accepted as long as all the remaining ones are aligned.
+        :returns the matching stride, 0 if none matches, -1 if more data is needed
+        """
+        lock_pattern = bytes([self.TS_SYNC_BYTE]) * self.SYNC_LOCK_PACKETS
+        for stride, prefix in self.PKT_FORMATS:
+            pattern = window[pos:pos + (self.SYNC_LOCK_PACKETS - 1) * stride + 1:stride]
+            if len(pattern) < self.SYNC_LOCK_PACKETS:
+                if not eof:
+                    return -1
+                if pos - prefix + stride > len(window):
+                    continue
+            if pattern == lock_pattern[:len(pattern)]:
+                return stride
+        return 0
+
+    def acquire_sync(self, data, offset: int, end: int, eof: bool = False) -> int:
+        """
+        Look for consecutive sync bytes in data[offset:end] and detect the packet stride
+        :returns offset of the first packet once locked, otherwise offset from which the
+                 search must be resumed when more data is available
+        """
+        max_span = (self.SYNC_LOCK_PACKETS - 1) * max(stride for stride, prefix in self.PKT_FORMATS)
+        start = offset
+        found = -1
+        stride = 0
+
+        while offset < end:
+            window_end = min(end, offset + self.SYNC_WINDOW + max_span)
+            window = bytes(data[offset:window_end])
+            pos = window.find(self.TS_SYNC_BYTE)
+            while pos >= 0:
+                stride = self.match_sync(window, pos, eof and window_end == end)
+                if stride > 0 and offset + pos >= self.PKT_PREFIX[stride]:
+                    found = offset + pos - self.PKT_PREFIX[stride]
+                    break
+                if stride < 0:
+                    # not enough data to confirm the lock
+                    break
+                pos = window.find(self.TS_SYNC_BYTE, pos + 1)
+
+            if found >= 0:
+                break
+            if pos < 0:
+                offset = window_end
+            else:
+                offset += pos
+                if window_end == end:
+                    # keep the bytes that may be the prefix of the candidate packet
+                    offset = max(start, offset - max(self.PKT_PREFIX.values()))
+                    break
+
+        self.sync_skipped += (offset if found < 0 else found) - start
+        if found < 0:
+            if eof and self.sync_skipped:
+                self.warning("no sync found, skipped %d bytes", self.sync_skipped)
+                self.skipped_bytes += self.sync_skipped
+                self.sync_skipped = 0
+            return offset
+
+        if self.sync_skipped:
+            self.warning("sync acquired after skipping %d bytes @%d", self.sync_skipped, self.pkt_count)
+        if stride != self.pkt_stride:
+            self.info("packet stride: %d bytes", stride)
+            self.pkt_stride = stride
+            self.pkt_prefix = self.PKT_PREFIX[stride]
+        self.skipped_bytes += self.sync_skipped
+        self.sync_skipped = 0
+        self.sync_misses = 0
+        self.sync_locked = True
+        return found
+
+    def parse_packets(self, data, end: int, eof: bool = False) -> int:
+        """
+        Parse all the complete packets available in data[:end]
+        :param eof: no more data will follow data[:end]
+        :returns offset of the first byte that was not consumed
+        """
+        offset = 0
+        base = self.stream_offset
+        pkt_len = self.TS_PKT_LEN
+        sync_byte = self.TS_SYNC_BYTE
+        parse_pkt = self.parse_pkt
+        handlers = self.pid_handlers.handlers
+        pid_flags = self.pid_handlers.flags
+        pid_counts = self.pid_handlers.counts
+        skip_flags = PidTable.FLAG_DROP | PidTable.FLAG_COUNT_ONLY
+        stride = self.pkt_stride
+        prefix = self.pkt_prefix
+
+        while end - offset >= stride:
+            if data[offset + prefix] != sync_byte or not self.sync_locked:
+                if self.sync_locked:
+                    self.sync_misses += 1
+                    if self.sync_misses < self.SYNC_LOSS_PACKETS:
+                        # keep the lock, drop the packet
+                        self.corrupted_packets += 1
+                        self.skipped_bytes += stride
+                        self.pkt_count += 1
+                        offset += stride
+                        continue
+                    self.warning("sync lost: %02x vs %02x @%d", data[offset + prefix], sync_byte, self.pkt_count)
+                    self.sync_locked = False
+
+                offset = self.acquire_sync(data, offset, end, eof)
+                if not self.sync_locked:
+                    break
+                stride = self.pkt_stride
+                prefix = self.pkt_prefix
+                continue
+            self.sync_misses = 0
+            self.pkt_offset = base + offset
+
+            if prefix:
+                # M2TS: 2 bits copy permission indicator + 30 bits arrival timestamp
+                self.arrival_timestamp = (((data[offset] & 0x3F) << 24) | (data[offset + 1] << 16)
+                                          | (data[offset + 2] << 8) | data[offset + 3])
+                offset += prefix
+
+            pid = ((data[offset + 1] & 0x1F) << 8) | data[offset + 2]
+            flags = pid_flags[pid]
+            if flags & skip_flags:
+                if flags & PidTable.FLAG_COUNT_ONLY:
+                    pid_counts[pid] += 1
+                offset += stride - prefix
+                self.pkt_count += 1
+                continue
+
+            pkt = parse_pkt(data[offset:offset + pkt_len])
+            offset += stride - prefix
+
+            if pkt is not None:
+                handler = handlers[pkt.pid]
+                if handler is not None:
+                    handler.read_payload(pkt.payload, pkt.pusi, pkt.scrambled, pkt.discontinuity, pkt.random_access)
+
+            self.pkt_count += 1
+
+        self.stream_offset = base + offset
+        return offset
+
+    def parse_packets_vectorized(self, data, end: int, eof: bool = False) -> int:
+        """
+        Same as parse_packets, but decode the headers and check continuity
+        of the whole block at once, only packets with a handler or carrying
+        a pcr are then processed one by one (requires numpy)
+        """
+        pkt_len = self.TS_PKT_LEN
+        if not self.sync_locked:
+            offset = self.acquire_sync(data, 0, end, eof)
+            self.stream_offset += offset
+            if not self.sync_locked:
+                return offset
+            return offset + self.parse_packets_vectorized(data[offset:end], end - offset, eof)
+
+        stride = self.pkt_stride
+        prefix = self.pkt_prefix
+        count = end // stride
+        if count == 0:
+            return 0
+
+        headers = PacketHeaders(data, count, stride, prefix)
+        sync_lost = headers.sync_lost_at(self.TS_SYNC_BYTE)
+        if sync_lost >= 0:
+            # decode packets before sync loss, let the scalar path handle the lock
+            offset = self.parse_packets_vectorized(data, sync_lost * stride)
+            return offset + self.parse_packets(data[offset:end], end - offset, eof)
+        self.sync_misses = 0
+
+        corrupted = int(headers.tei.sum())
+        if corrupted:
+            self.warning("transport_error_indicator set on %d packets", corrupted)
+        invalid_afield = int(headers.corrupted.sum())
+        if invalid_afield:
+            self.error("invalid adaptation field length in %d packets @%d", invalid_afield, self.pkt_count)
+        self.corrupted_packets += corrupted + invalid_afield
+
+        pid_handlers = self.pid_handlers
+        headers.apply_pid_flags(pid_handlers)
+
+        discontinuities = set()
+        for idx in headers.check_continuity(self.continuity_counters).tolist():
+            self.warning("continuity check failed for PID 0x%02x @%d",
+                         int(headers.pid[idx]), self.pkt_count + idx)
+            discontinuities.add(idx)
+        self.continuity_errors += len(discontinuities)
+        self.on_packet_headers(data, headers, discontinuities)
+
+        handlers = pid_handlers.handlers
+        pid_flags = pid_handlers.flags
+        afield_flags = PidTable.FLAG_PCR | PidTable.FLAG_AFIELD
+        first_pkt = self.pkt_count
+        base = self.stream_offset
+        start = 0
+        while start < count:
+            # handlers can be added or removed while processing psi
+            version = pid_handlers.version
+            indices = headers.select(start, pid_handlers)
+            pids = headers.pid[indices].tolist()
+            pusis = headers.pusi[indices].tolist()
+            scrambled = headers.scrambled[indices].tolist()
+            afield_ctrls = headers.afield_ctrl[indices].tolist()
+            afield_lens = headers.afield_len[indices].tolist()
+            if prefix:
+                arrival_timestamps = headers.arrival_timestamp[indices].tolist()
+            else:
+                arrival_timestamps = repeat(self.arrival_timestamp)
+            start = count
+
+            for idx, pid, pusi, scrambling, afield_ctrl, afield_len, arrival_timestamp in zip(
+                    indices, pids, pusis, scrambled, afield_ctrls, afield_lens, arrival_timestamps):
+                offset = idx * stride + prefix
+                self.pkt_count = first_pkt + idx
+                self.pkt_offset = base + offset - prefix
+                self.arrival_timestamp = arrival_timestamp
+                if afield_ctrl & 0x2:
+                    if pid_flags[pid] & afield_flags:
+                        self.decode_adaptation_field(pid, data[offset + 4:offset + afield_len + 5])
+                    payload_offset = offset + afield_len + 5
+                    random_access = afield_len > 0 and (data[offset + 5] & 0x40) != 0
+                else:
+                    payload_offset = offset + 4
+                    random_access = False
+
+                handler = handlers[pid]
+                if handler is None or not afield_ctrl & 0x1:
+                    continue
+
+                handler.read_payload(data[payload_offset:offset + pkt_len], pusi, scrambling,
+                                     idx in discontinuities, random_access)
+
+                if pid_handlers.version != version:
+                    start = idx + 1
+                    break
+
+            headers.count_pids(start, pid_handlers)
+
+        self.pkt_count = first_pkt + count
+        self.stream_offset = base + count * stride
+        return count * stride
+
+    def read_pcr(self, data, offset: int, pcr_pid: int) -> int:
+        """
+        :returns the 33 bits pcr base (90kHz) of the packet at data[offset] if it belongs to pcr_pid, -1 otherwise
+        """
+        if data[offset] != self.TS_SYNC_BYTE or ((data[offset + 1] & 0x1F) << 8) | data[offset + 2] != pcr_pid:
+            return -1
+        if not data[offset + 3] & 0x20 or data[offset + 4] < 7 or not data[offset + 5] & 0x10:
+            return -1
+        return ((data[offset + 6] << 25) | (data[offset + 7] << 17) | (data[offset + 8] << 9)
+                | (data[offset + 9] << 1) | (data[offset + 10] >> 7))
+
+    def find_pcr(self, stream, first: int, last: int, origin: int, pcr_pid: int) -> (int, int):
+        """
+        Look for the first pcr of pcr_pid in packets [first, last), packets are aligned on the stride from origin
+        :returns packet index and pcr base, (-1, -1) if not found
+        """
+        stride = self.pkt_stride
+        prefix = self.pkt_prefix
+        while first < last:
+            count = min(last - first, self.SEEK_PROBE_PACKETS)
+            stream.seek(origin + first * stride)
+            data = stream.read(count * stride)
+            for idx in range(len(data) // stride):
+                pcr = self.read_pcr(data, idx * stride + prefix, pcr_pid)
+                if pcr >= 0:
+                    return first + idx, pcr
+            if len(data) < count * stride:
+                break
+            first += count
+        return -1, -1
+
+    def seek_to_time(self, stream, time_ms: float, program_id: Optional[int] = None) -> int:
+        """
+        Move a seekable stream to the packet carrying the last pcr <= time_ms, by bisection
+        over packet aligned offsets, only a few packets are read at each step. The psi
+        and the packet stride are found at the start of the stream when needed.
+        :param time_ms: ms from the first pcr of the program, the first program if None
+        :returns offset of the packet, -1 if no pcr was found
+        """
+        size = stream.seek(0, os.SEEK_END)
+        stream.seek(0)
+        probe = TsParser(drop_unhandled=True)
+        head = stream.read(min(self.BLOCK_SIZE, size))
+        origin = probe.acquire_sync(head, 0, len(head), eof=len(head) == size)
+        if not probe.sync_locked:
+            self.warning("seek: no sync found")
+            return -1
+        self.pkt_stride = probe.pkt_stride
+        self.pkt_prefix = probe.pkt_prefix
+
+        programs_pcr_pid = self.programs_pcr_pid
+        if not programs_pcr_pid or (program_id is not None and program_id not in programs_pcr_pid):
+            probe.feed(head[origin:])
+            read_len = len(head)
+            while (not probe.programs_pcr_pid or (program_id is not None and program_id not in probe.programs_pcr_pid)) \
+                    and read_len < min(size, self.SEEK_PSI_SIZE):
+                chunk = stream.read(self.BLOCK_SIZE)
+                read_len += len(chunk)
+                probe.feed(chunk)
+            programs_pcr_pid = probe.programs_pcr_pid
+        if program_id is None and programs_pcr_pid:
+            program_id = min(programs_pcr_pid)
+        if program_id not in programs_pcr_pid:
+            self.warning("seek: pcr pid of program %s not found", program_id)
+            return -1
+        pcr_pid = programs_pcr_pid[program_id]
+
+        nb_pkts = (size - origin) // self.pkt_stride
+        lo, first_pcr = self.find_pcr(stream, 0, nb_pkts, origin, pcr_pid)
+        if lo < 0:
+            self.warning("seek: no pcr found for program %d", program_id)
+            return -1
+
+        # pcr are compared relative to the first one, modulo the 33 bits rollover
+        target = time_ms * 90
+        hi = nb_pkts
+        # invariant: packet lo carries a pcr <= target, all the pcr from packet hi are > target
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            idx, pcr = self.find_pcr(stream, mid, hi, origin, pcr_pid)
+            if idx >= 0 and (pcr - first_pcr) % self.PCR_WRAP <= target:
+                lo = idx
+            else:
+                hi = mid
+
+        offset = origin + lo * self.pkt_stride
+        stream.seek(offset)
+        self.stream_offset = offset
+        self.pkt_count = lo
+        self.sync_locked = False
+        self.feed_pending = bytearray()
+        self.continuity_counters.clear()
+        for handler in self.pid_handlers.values():
+            handler.drop_partial()
+        return offset
+
+    def parse(self, stream, block_size: int = BLOCK_SIZE, vectorized: bool = False, read_ahead: int = 0):
+        """
+        :param read_ahead: number of blocks read in advance by a background thread,
+                           0 to read the blocks inline
+        """
+        if read_ahead > 0:
+            self.parse_read_ahead(stream, block_size, vectorized, read_ahead)
+            return
+        try:
+            self.stream_offset = stream.tell()
+        except (AttributeError, OSError):
+            pass
+
+        # only read whole packets, a partial packet at the end of a block
+        # is moved to the start of the buffer before reading the next one
+        block_size = max(block_size // self.TS_PKT_LEN, 1) * self.TS_PKT_LEN
+        buf = bytearray(max(block_size, self.MIN_BLOCK_SIZE))
+        view = memoryview(buf)
+        readinto = getattr(stream, "readinto", None)
+        parse_packets = self.parse_packets_vectorized if vectorized else self.parse_packets
+        pending = 0
 
-    def parse(self, stream):
         while True:
-            ts_pkt = stream.read(self.TS_PKT_LEN)
-            if not ts_pkt:
+            if pending == len(buf):
+                # nothing consumed from a full buffer (sync acquisition), make room for more data
+                view.release()
+                buf.extend(bytes(block_size))
+                view = memoryview(buf)
+            if readinto is not None:
+                read_len = readinto(view[pending:])
+            else:
+                chunk = stream.read(len(buf) - pending)
+                read_len = len(chunk)
+                view[pending:pending + read_len] = chunk
+            if not read_len:
+                if pending:
+                    parse_packets(view, pending, eof=True)
                 break
 
-            idx = 0
-            while ts_pkt[idx] != self.TS_SYNC_BYTE:
-                # resync
-                self.warning("need resync: %02x vs %02x" % (ts_pkt[0], self.TS_SYNC_BYTE))
-                extra = tsfile.read(1)
-                if not extra:
+            end = pending + read_len
+            offset = parse_packets(view, end)
+            pending = end - offset
+            if pending:
+                buf[:pending] = buf[offset:end]
+
+        view.release()
+        self.info("done")
+
+    def parse_read_ahead(self, stream, block_size: int = BLOCK_SIZE, vectorized: bool = False, read_ahead: int = 2):
+        """
+        Parse a stream while a background thread reads the next blocks in a ring
+        of read_ahead + 1 buffers, blocks are parsed in place through feed()
+        """
+        block_size = max(block_size // self.TS_PKT_LEN, 1) * self.TS_PKT_LEN
+        try:
+            self.stream_offset = stream.tell()
+        except (AttributeError, OSError):
+            pass
+        reader = ReadAheadReader(stream, block_size, read_ahead + 1)
+        reader.start()
+        try:
+            while True:
+                buf, read_len = reader.get()
+                if not read_len:
                     break
-                ts_pkt = ts_pkt[1:] + extra
+                with memoryview(buf) as view:
+                    self.feed(view[:read_len], vectorized)
+                reader.release(buf)
+        finally:
+            reader.stop()
 
-            pid, pusi, discountinuity, scrambled, payload = self.parse_pkt(ts_pkt)
+        self.flush(vectorized)
+        self.info("done")
 
-            if pid in self.pid_handlers:
-                self.pid_handlers[pid].read_payload(payload, pusi, scrambled, discountinuity)
+    def feed(self, chunk, vectorized: bool = False):
+        """
+        Push mode: parse all the complete packets available in chunk, along with
+        the data left by the previous calls. Incomplete data is kept for the next call.
+        """
+        parse_packets = self.parse_packets_vectorized if vectorized else self.parse_packets
+        data = chunk
+        pending = self.feed_pending
+        if pending:
+            need = self.pkt_stride - len(pending)
+            if self.sync_locked and 0 < need <= len(chunk):
+                # only complete the pending packet, the rest of the chunk is parsed in place
+                pending += chunk[:need]
+                offset = parse_packets(memoryview(pending), len(pending))
+                data = memoryview(chunk)[need:]
+                if offset < len(pending):
+                    data = pending[offset:] + data
+            else:
+                pending += chunk
+                data = pending
+
+        view = memoryview(data)
+        offset = parse_packets(view, len(view))
+        self.feed_pending = bytearray(view[offset:])
+
+    def flush(self, vectorized: bool = False):
+        """
+        Push mode: no more data will be fed, parse what is left
+        """
+        parse_packets = self.parse_packets_vectorized if vectorized else self.parse_packets
+        pending = self.feed_pending
+        if pending:
+            offset = parse_packets(memoryview(pending), len(pending), eof=True)
+            self.stream_offset += len(pending) - offset
+        self.feed_pending = bytearray()
+
+    def parse_file(self, path: str, vectorized: bool = False):
+        """
+        Parse a file through a read only memory map, packets are handed
+        to the handlers as slices of the mapping without any copy
+        """
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                self.info("done")
+                return
 
-            self.pkt_count += 1
+            self.stream_offset = 0
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                self.parse_mapped(mm, vectorized)
+            except BaseException:
+                # the traceback frames can still hold slices of the mapping,
+                # it is then closed once they are released
+                try:
+                    mm.close()
+                except BufferError:
+                    pass
+                raise
+            mm.close()
 
         self.info("done")
 
+    def parse_mapped(self, mm: mmap.mmap, vectorized: bool = False):
+        if hasattr(mm, "madvise"):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+        parse_packets = self.parse_packets_vectorized if vectorized else self.parse_packets
+        # parse the mapping by blocks, the vectorized path allocates arrays the size of the data
+        with memoryview(mm) as view:
+            end = len(view)
+            offset = 0
+            block_size = self.BLOCK_SIZE
+            while offset < end:
+                stop = min(offset + block_size, end)
+                consumed = parse_packets(view[offset:stop], stop - offset, eof=stop == end)
+                if stop == end:
+                    break
+                # nothing consumed (sync acquisition), retry with more data
+                block_size = self.BLOCK_SIZE if consumed else block_size + self.BLOCK_SIZE
+                offset += consumed
+
 
 if __name__ == '__main__':
     parser = TsParser(verbose=False)
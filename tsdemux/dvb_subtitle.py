@@ -1,5 +1,6 @@
 import sys
 
+from tsdemux import logger
 from tsdemux.demux import TsParser
 from tsdemux.es import Es
 from tsdemux.pes import PesReader
@@ -8,6 +9,9 @@ from tsdemux.pes import PesReader
 class DvbSubtitlePage:
 
     class Region:
+        __slots__ = ("id", "x", "y", "fill", "width", "height", "level_of_compatibility", "depth", "clut_id",
+                     "bg_color", "objects")
+
         def __init__(self, region_id, x, y):
             self.id = region_id
             self.x = x
@@ -25,6 +29,8 @@ class DvbSubtitlePage:
             return f"region {self.id} x: {self.x} y: {self.y} size: {self.width}x{self.height}"
 
     class Object:
+        __slots__ = ("id", "type", "x", "y", "foreground", "background")
+
         def __init__(self, object_id, object_type, x, y):
             self.id = object_id
             self.type = object_type
@@ -79,24 +85,36 @@ class DvbSubtitleParser(PesReader):
 
     def __init__(self, pid: int, es: Es):
         super().__init__(pid, es)
-        self.verbose_debug = True
+        self.verbose_debug = not logger.quiet
         self.pages = {}
         dvb_subtitle_desc: Es.DvbSubtitleDescriptor = es.descriptors[Es.DESCRIPTOR_TAG_DVB_SUBTITLE]
-        lang = list(dvb_subtitle_desc.langs.keys())[0]
         if len(dvb_subtitle_desc.langs.keys()) != 1:
-            self.warning(f"only process first lang: {lang}")
+            self.warning(f"only process first lang: {list(dvb_subtitle_desc.langs.keys())[0]}")
 
-        composition_page_id = dvb_subtitle_desc.langs[lang]['composition_page_id']
-        ancillary_page_id = dvb_subtitle_desc.langs[lang]['ancillary_page_id']
+        composition_page_id, ancillary_page_id = self.page_ids(es)
         self.pages[composition_page_id] = DvbSubtitlePage(composition_page_id)
         if ancillary_page_id != composition_page_id:
             self.pages[ancillary_page_id] = DvbSubtitlePage(ancillary_page_id)
 
+    @staticmethod
+    def page_ids(es: Es) -> (int, int):
+        """:returns composition and ancillary page ids of the first lang"""
+        dvb_subtitle_desc: Es.DvbSubtitleDescriptor = es.descriptors[Es.DESCRIPTOR_TAG_DVB_SUBTITLE]
+        lang = list(dvb_subtitle_desc.langs.keys())[0]
+        return dvb_subtitle_desc.langs[lang]['composition_page_id'], dvb_subtitle_desc.langs[lang]['ancillary_page_id']
+
+    def update_es(self, es: Es) -> bool:
+        # pages are set up from the descriptor
+        if Es.DESCRIPTOR_TAG_DVB_SUBTITLE not in es.descriptors or self.page_ids(es) != self.page_ids(self.es):
+            return False
+        return super().update_es(es)
+
     def process_segment(self, segment_type: int, page: DvbSubtitlePage, data: bytearray):
         data_len = len(data)
         segment_name = self.SEGMENT_NAME.get(segment_type, "unknown")
-        self.verbose(f"- segment: {segment_name} (0x{segment_type:02x}) | page {page} "
-                     f"| len: {data_len} | data {data[:32].hex()}")
+        if self.verbose_debug:
+            self.verbose("- segment: %s (0x%02x) | page %s | len: %d | data %s",
+                         segment_name, segment_type, page, data_len, data[:32].hex())
 
         if segment_type == self.SEGMENT_DISPLAY_DEFINITION:
             if data_len < 5:
@@ -121,9 +139,9 @@ class DvbSubtitleParser(PesReader):
                 page.window_height = page.display_height
                 page.window_x = 0
                 page.window_y = 0
-            self.verbose(f"    size: {page.display_width}x{page.display_height} "
-                         f"window: x: {page.window_x}, y: {page.window_y}, "
-                         f"size: {page.window_width}x{page.window_height}")
+            self.verbose("    size: %dx%d window: x: %d, y: %d, size: %dx%d",
+                         page.display_width, page.display_height, page.window_x, page.window_y,
+                         page.window_width, page.window_height)
         elif segment_type == self.SEGMENT_PAGE_COMPOSITION:
             if data_len < 2:
                 raise DvbSubtitleParseError(f"page composition segment is too short {data_len}")
@@ -132,7 +150,7 @@ class DvbSubtitleParser(PesReader):
             page_state = (data[1] >> 2) & 0x03
             left = data_len - 2
             offset = 2
-            self.verbose(f"    timeout: {page.timeout_seconds}, state: {page_state}")
+            self.verbose("    timeout: %d, state: %d", page.timeout_seconds, page_state)
             while left >= 6:
                 region_id = data[offset]
                 offset += 2
@@ -152,7 +170,7 @@ class DvbSubtitleParser(PesReader):
                 else:
                     region.x = region_x
                     region.y = region_y
-                self.verbose(f"    {region}")
+                self.verbose("    %s", region)
             if left != 0:
                 self.warning(f"left over {left} when parsing page composition")
         elif segment_type == self.SEGMENT_REGION_COMPOSITION:
@@ -179,7 +197,7 @@ class DvbSubtitleParser(PesReader):
                 region.bg_color = data[9] & 0x3
             else:
                 raise DvbSubtitleParseError(f"invalid region depth {region.depth}")
-            self.verbose(f"  |- {region}")
+            self.verbose("  |- %s", region)
             left = data_len - 10
             offset = 10
             while left >= 6:
@@ -211,7 +229,7 @@ class DvbSubtitleParser(PesReader):
                 else:
                     obj.foreground = -1
                     obj.background = -1
-                self.verbose(f"  |---- {obj}")
+                self.verbose("  |---- %s", obj)
             if left != 0:
                 self.warning(f"left over {left} when parsing region composition")
 
@@ -230,7 +248,8 @@ class DvbSubtitleParser(PesReader):
         data = section.data
         data_len = len(data)
 
-        self.verbose(f"got dvb packet {data[:32].hex()}... (len: {data_len})")
+        if self.verbose_debug:
+            self.verbose("got dvb packet %s... (len: %d)", data[:32].hex(), data_len)
 
         if data_len < 3:
             self.error(f"too short dvb subtitle pes {data_len}")
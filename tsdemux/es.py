@@ -2,6 +2,9 @@ from tsdemux.logger import LogEnabled
 
 
 class Es(LogEnabled):
+    __slots__ = ("pid", "stream_type", "raw_descriptors", "media_type", "descriptors", "name", "langs",
+                 "priv_stream_type")
+
     DESCRIPTOR_TAG_VIDEO = 0x02
     DESCRIPTOR_TAG_AUDIO = 0x03
     DESCRIPTOR_TAG_DATA_STREAM_ALIGNMENT = 0x06
@@ -229,6 +232,7 @@ class Es(LogEnabled):
         self.log_prefix = "[ES:%04d] " % pid
         self.pid = pid
         self.stream_type = stream_type
+        self.raw_descriptors = bytes(descriptors)
         self.media_type = self.MEDIA_TYPE_UNKNOWN
         self.descriptors = {}
         self.name = ""
@@ -266,23 +270,35 @@ class Es(LogEnabled):
         if desc_len == 0:
             return
 
-        self.verbose("descriptors: len: %d %s", desc_len, data.hex())
+        verbose = self.verbose_debug
+        if verbose:
+            self.verbose("descriptors: len: %d %s", desc_len, data.hex())
 
         while desc_len > 2:
             tag = data[offset]
             cur_len = data[offset+1]
             offset += 2
 
-            self.verbose("descriptor: 0x%02x (%d) len: %d %s", tag, tag,
-                         cur_len, data[offset:offset+cur_len].hex())
+            if verbose:
+                self.verbose("descriptor: 0x%02x (%d) len: %d %s", tag, tag,
+                             cur_len, data[offset:offset+cur_len].hex())
 
             descriptor = self.parse_descriptor(tag, data, offset, cur_len)
             if descriptor is not None:
                 self.descriptors[tag] = descriptor
-                self.info(f"  - {descriptor}")
+                self.info("  - %s", descriptor)
 
             offset += cur_len
             desc_len -= 2 + cur_len
 
+    def __eq__(self, other):
+        if not isinstance(other, Es):
+            return NotImplemented
+        return (self.pid == other.pid and self.stream_type == other.stream_type
+                and self.raw_descriptors == other.raw_descriptors)
+
+    def __hash__(self):
+        return hash((self.pid, self.stream_type, self.raw_descriptors))
+
     def __str__(self):
         return "[ES:%d|0x%04x] (stream_type: 0x%02x) %s" % (self.pid, self.pid, self.stream_type, self.name)
@@ -0,0 +1,218 @@
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+from typing import Optional
+
+from tsdemux.adaptation_field import AdaptationField
+from tsdemux.demux import TsParser
+from tsdemux.es import Es
+from tsdemux.pes import H264KeyframeScanner, PesReader
+from tsdemux.reader import TsReader
+
+
+class TsIndex:
+    """
+    Time to byte offset index of a file: (pcr, offset) samples per program and
+    (pts, offset, random access) samples per pes pid. Times are in ms, unwrapped
+    across the 33 bits rollover, offsets are the ones of the packets carrying them.
+    """
+
+    SIDECAR_EXT = ".tsidx"
+    MAGIC = b"TSIX"
+    VERSION = 1
+    # 33 bits timestamps rollover, in ms
+    WRAP_MS = (1 << 33) / 90
+
+    class Samples:
+        def __init__(self):
+            self.times = array('d')
+            self.offsets = array('Q')
+            self.random_access = array('B')
+            # added to incoming times to unwrap them
+            self.wrap = 0.0
+
+        def add(self, time: float, offset: int, random_access: bool = False):
+            time += self.wrap
+            if self.times and time < self.times[-1] - TsIndex.WRAP_MS / 2:
+                self.wrap += TsIndex.WRAP_MS
+                time += TsIndex.WRAP_MS
+            self.times.append(time)
+            self.offsets.append(offset)
+            self.random_access.append(random_access)
+
+        def __len__(self) -> int:
+            return len(self.times)
+
+    def __init__(self):
+        self.pcr = {}
+        self.pts = {}
+
+    def add_pcr(self, program_id: int, pcr: float, offset: int):
+        samples = self.pcr.get(program_id)
+        if samples is None:
+            samples = self.pcr[program_id] = self.Samples()
+        samples.add(pcr, offset)
+
+    def add_pts(self, pid: int, pts: float, offset: int, random_access: bool):
+        samples = self.pts.get(pid)
+        if samples is None:
+            samples = self.pts[pid] = self.Samples()
+        samples.add(pts, offset, random_access)
+
+    def offset_at(self, time: float, program_id: Optional[int] = None) -> int:
+        """
+        :param time: ms from the first pcr of the program, the first program if None
+        :returns offset of the packet carrying the last pcr <= time
+        """
+        if program_id is None:
+            program_id = min(self.pcr)
+        samples = self.pcr[program_id]
+        idx = bisect_right(samples.times, samples.times[0] + time)
+        return samples.offsets[max(idx - 1, 0)]
+
+    def pts_offset_at(self, pid: int, pts: float, random_access: bool = True) -> int:
+        """
+        :param pts: unwrapped pts in ms
+        :param random_access: only consider pes packets flagged as random access points
+        :returns offset of the packet starting the last pes packet with a pts <= pts
+        """
+        samples = self.pts[pid]
+        idx = bisect_right(samples.times, pts) - 1
+        if random_access:
+            while idx > 0 and not samples.random_access[idx]:
+                idx -= 1
+        return samples.offsets[max(idx, 0)]
+
+    def keyframes(self, pid: int) -> list:
+        """:returns (pts, offset) of the random access points of a pes pid"""
+        samples = self.pts[pid]
+        return [(samples.times[idx], samples.offsets[idx])
+                for idx, random_access in enumerate(samples.random_access) if random_access]
+
+    def seek(self, stream, time: float, program_id: Optional[int] = None) -> int:
+        """
+        Move stream to the packet carrying the last pcr <= time, see offset_at()
+        :returns the new stream position
+        """
+        offset = self.offset_at(time, program_id)
+        stream.seek(offset)
+        return offset
+
+    @staticmethod
+    def write_array(f, values: array):
+        if sys.byteorder != "little":
+            values = array(values.typecode, values)
+            values.byteswap()
+        f.write(values.tobytes())
+
+    @staticmethod
+    def read_array(f, typecode: str, count: int) -> array:
+        values = array(typecode)
+        data = f.read(values.itemsize * count)
+        if len(data) != values.itemsize * count:
+            raise ValueError("truncated index")
+        values.frombytes(data)
+        if sys.byteorder != "little":
+            values.byteswap()
+        return values
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            f.write(struct.pack("<4sHHH", self.MAGIC, self.VERSION, len(self.pcr), len(self.pts)))
+            for key, samples, with_flags in ([(key, samples, False) for key, samples in sorted(self.pcr.items())]
+                                             + [(key, samples, True) for key, samples in sorted(self.pts.items())]):
+                f.write(struct.pack("<HId", key, len(samples), samples.wrap))
+                self.write_array(f, samples.times)
+                self.write_array(f, samples.offsets)
+                if with_flags:
+                    self.write_array(f, samples.random_access)
+
+    @classmethod
+    def load(cls, path: str) -> "TsIndex":
+        index = cls()
+        with open(path, "rb") as f:
+            header = f.read(struct.calcsize("<4sHHH"))
+            magic, version, nb_programs, nb_pids = struct.unpack("<4sHHH", header)
+            if magic != cls.MAGIC or version != cls.VERSION:
+                raise ValueError(f"unsupported index file {path}")
+            for table, count, with_flags in ((index.pcr, nb_programs, False), (index.pts, nb_pids, True)):
+                for _ in range(count):
+                    key, nb_samples, wrap = struct.unpack("<HId", f.read(struct.calcsize("<HId")))
+                    samples = table[key] = cls.Samples()
+                    samples.wrap = wrap
+                    samples.times = cls.read_array(f, 'd', nb_samples)
+                    samples.offsets = cls.read_array(f, 'Q', nb_samples)
+                    if with_flags:
+                        samples.random_access = cls.read_array(f, 'B', nb_samples)
+                    else:
+                        samples.random_access = array('B', bytes(nb_samples))
+        return index
+
+    @classmethod
+    def build(cls, path: str, vectorized: bool = False) -> "TsIndex":
+        indexer = TsIndexer()
+        indexer.parse_file(path, vectorized)
+        return indexer.index
+
+    @classmethod
+    def open(cls, path: str) -> "TsIndex":
+        """Load the sidecar index of a file, build and save it first if missing or outdated"""
+        sidecar = path + cls.SIDECAR_EXT
+        if os.path.exists(sidecar) and os.path.getmtime(sidecar) >= os.path.getmtime(path):
+            return cls.load(sidecar)
+        index = cls.build(path)
+        index.save(sidecar)
+        return index
+
+
+class PtsIndexReader(TsReader):
+    """
+    Only decode the pts of the pes packet headers, pes packets are random access points
+    if the random access indicator is set or if their first H264 slice is an IDR slice
+    """
+
+    def __init__(self, pid: int, es: Es, indexer: "TsIndexer"):
+        self.pid = pid
+        self.indexer = indexer
+        self.h264 = es.stream_type == Es.STREAM_TYPE_H264
+        self.idr_scanner = H264KeyframeScanner()
+
+    def read_payload(self, data: bytearray, pusi: bool, scrambled: int, discontinuity: bool,
+                     random_access: bool = False):
+        if not pusi:
+            # the pts sample of the pes packet was already added, flag it once its first slice is found
+            if self.idr_scanner.pending and scrambled == 0 and self.idr_scanner.scan(data):
+                self.indexer.index.pts[self.pid].random_access[-1] = True
+            return
+        self.idr_scanner.pending = False
+        if len(data) < 14 or data[0:3] != b'\x00\x00\x01' or not data[7] & 0x80:
+            return
+        if not random_access and self.h264 and scrambled == 0:
+            self.idr_scanner.start()
+            random_access = self.idr_scanner.scan(data[9 + data[8]:])
+        self.indexer.index.add_pts(self.pid, PesReader.read_pts(data, 9), self.indexer.pkt_offset, random_access)
+
+    def drop_partial(self):
+        self.idr_scanner.pending = False
+
+
+class TsIndexer(TsParser):
+    """Parser filling a TsIndex, pes payloads are not reassembled"""
+
+    def __init__(self, verbose=False):
+        super().__init__(verbose=verbose, drop_unhandled=True)
+        self.index = TsIndex()
+
+    def on_stream_added(self, program_id: int, pid: int, es: Es):
+        self.pid_handlers[pid] = PtsIndexReader(pid, es, self)
+
+    def on_stream_removed(self, program_id: int, pid: int, es: Es):
+        if isinstance(self.pid_handlers.get(pid), PtsIndexReader):
+            del self.pid_handlers[pid]
+
+    def on_adaptation_field(self, pid: int, afield: AdaptationField):
+        if afield.has_pcr:
+            for program_id in self.pcr_pid_programs.get(pid, ()):
+                self.index.add_pcr(program_id, self.programs_pcr[program_id], self.pkt_offset)
@@ -5,6 +5,20 @@ from colorlog import ColoredFormatter
 
 loggers = {}
 
+# quiet production mode: verbose logs are disabled and only warnings and errors are emitted
+quiet = False
+
+
+def set_quiet(enabled: bool = True):
+    """
+    Enable or disable quiet production mode. Logger levels are updated right
+    away, verbose logs are disabled for the readers created afterwards.
+    """
+    global quiet
+    quiet = enabled
+    for logger in loggers.values():
+        logger.setLevel(logging.WARNING if quiet else logging.DEBUG)
+
 
 def get_logger(name, level=logging.INFO):
     if name in loggers:
@@ -17,16 +31,23 @@ def get_logger(name, level=logging.INFO):
     main_stream.setFormatter(formatter)
 
     logger = logging.getLogger(name)
-    logger.setLevel(level)
+    logger.setLevel(max(level, logging.WARNING) if quiet else level)
     logger.addHandler(main_stream)
     loggers[name] = logger
     return logger
 
 
 class LogEnabled:
+    """
+    Logging helpers: messages are formatted lazily with %-style args, and the
+    log prefix is only added when the level is enabled. Hot paths should test
+    verbose_debug before computing costly args.
+    """
+
+    __slots__ = ("verbose_debug", "log_prefix", "logger")
 
     def __init__(self, log_name="ts", prefix="", verbose=False):
-        self.verbose_debug = verbose
+        self.verbose_debug = verbose and not quiet
         if prefix == "":
             self.log_prefix = ""
         else:
@@ -38,14 +59,16 @@ class LogEnabled:
             self.logger.debug(self.log_prefix + msg, *args)
 
     def debug(self, msg, *args):
-        self.logger.debug(self.log_prefix + msg, *args)
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(self.log_prefix + msg, *args)
 
     def info(self, msg, *args):
-        self.logger.info(self.log_prefix + msg, *args)
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info(self.log_prefix + msg, *args)
 
     def warning(self, msg, *args):
-        self.logger.warning(self.log_prefix + msg, *args)
+        if self.logger.isEnabledFor(logging.WARNING):
+            self.logger.warning(self.log_prefix + msg, *args)
 
     def error(self, msg, *args):
         self.logger.error(self.log_prefix + msg, *args)
-
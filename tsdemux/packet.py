@@ -0,0 +1,27 @@
+import struct
+
+
+class TsPacket:
+    """
+    Header fields of a ts packet as returned by TsParser.parse_pkt, the payload
+    is a view on the parsed data, only valid until the next block is parsed
+    """
+
+    __slots__ = ("pid", "pusi", "scrambled", "continuity_counter", "discontinuity", "random_access", "payload")
+
+    # sync byte, tei | pusi | priority | pid, scrambling | adaptation field control | continuity counter
+    HEADER = struct.Struct(">xHB")
+
+    def __init__(self, pid: int, pusi: bool, scrambled: int, continuity_counter: int,
+                 discontinuity: bool, random_access: bool, payload):
+        self.pid = pid
+        self.pusi = pusi
+        self.scrambled = scrambled
+        self.continuity_counter = continuity_counter
+        self.discontinuity = discontinuity
+        self.random_access = random_access
+        self.payload = payload
+
+    def __str__(self):
+        return "[TS PKT|pid:0x%04x%s] cc: %d len: %d" % (
+            self.pid, self.pusi and "|PUSI" or "", self.continuity_counter, len(self.payload))
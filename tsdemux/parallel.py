@@ -0,0 +1,340 @@
+import mmap
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Set
+
+from tsdemux.adaptation_field import AdaptationField
+from tsdemux.demux import TsParser
+from tsdemux.es import Es
+from tsdemux.logger import LogEnabled
+from tsdemux.pes import PesPacket, PesReader
+from tsdemux.pid_table import PidTable
+
+
+class PartialPesPacket:
+    """Pes packet still incomplete at the end of a range"""
+
+    def __init__(self, packet: PesPacket, chunks: List[bytes], bounded: bool, data_left: int):
+        self.packet = packet
+        self.chunks = chunks
+        # pes packet size is known, it completes once data_left bytes are appended
+        self.bounded = bounded
+        self.data_left = data_left
+
+    def append(self, scrambling: int, data: bytes):
+        self.chunks.append(data)
+        self.packet.scrambled = self.packet.scrambled or scrambling != 0
+        if self.bounded:
+            self.data_left = max(self.data_left - len(data), 0)
+
+    def complete(self) -> PesPacket:
+        self.packet.data = b"".join(self.chunks)
+        return self.packet
+
+
+class RangeResult:
+    """Picklable outcome of the demux of one range, merged by ParallelTsParser"""
+
+    def __init__(self, index: int, start: int, end: int):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.pkt_count = 0
+        self.corrupted_packets = 0
+        self.continuity_errors = 0
+        self.skipped_bytes = 0
+        # continuity counters of the first and last packets of each pid
+        self.first_cc = {}
+        self.last_cc = {}
+        # first and last pcr (ms) of each program
+        self.first_pcr = {}
+        self.last_pcr = {}
+        self.pes_packets = []
+        # pes payloads (scrambling, data) of each pid preceding its first pusi
+        self.heads = {}
+        # pids with a pes packet starting in the range
+        self.started = set()
+        # pes packets incomplete at the end of the range
+        self.tails = {}
+
+
+class RangePesReader(PesReader):
+    """Pes reader keeping the payload preceding the first pusi for the merge"""
+
+    def __init__(self, pid: int, es: Es, program_id: int, demuxer: "RangeDemuxer"):
+        super().__init__(pid, es)
+        self.program_id = program_id
+        self.demuxer = demuxer
+        self.started = False
+        self.head = []
+
+    def read_payload(self, data: bytearray, pusi: bool, scrambling: int, discontinuity: bool,
+                     random_access: bool = False):
+        if not self.started:
+            if not pusi:
+                self.head.append((scrambling, bytes(data)))
+                return
+            self.started = True
+        super().read_payload(data, pusi, scrambling, discontinuity, random_access)
+
+    def on_pes_packet_complete(self):
+        if self.sections is None:
+            return
+
+        # section buffers are reused, copy them
+        data = b"".join(section.data for section in self.sections)
+        scrambled = any(section.scrambling != 0 for section in self.sections)
+        self.demuxer.on_pes_packet(PesPacket(self.program_id, self.pid, self.es, self.pts, self.dts, scrambled, data))
+
+    def tail(self) -> Optional[PartialPesPacket]:
+        """:returns the pes packet in progress, if any"""
+        if self.sections is None or self.cur_section is None:
+            return None
+
+        sections = self.sections + [self.cur_section]
+        chunks = [bytes(section.data) for section in sections if section.size]
+        scrambled = any(section.scrambling != 0 for section in sections)
+        packet = PesPacket(self.program_id, self.pid, self.es, self.pts, self.dts, scrambled, b"")
+        return PartialPesPacket(packet, chunks, self.pes_packet_len > 0, self.data_left)
+
+
+class RangeDemuxer(TsParser):
+    """
+    Demux one packet aligned range of a file in a worker process. The psi state
+    is first warmed up from the data preceding the range, only psi pids are
+    processed during the warm up. Subclasses can override on_pes_packet to
+    reduce what is sent back to the main process.
+    """
+
+    def __init__(self, media_types: Optional[Set[int]] = None, verbose=False, drop_unhandled=False):
+        """
+        :param media_types: media types (Es.MEDIA_TYPE_*) of the streams to demux, all if None
+        """
+        super().__init__(verbose=verbose, drop_unhandled=True)
+        self.media_types = media_types
+        self.drop_unhandled = drop_unhandled
+        self.warming_up = True
+        # streams found during the warm up, readers are added once it is over
+        self.warmup_streams = {}
+        self.first_pkt = 0
+        self.first_cc = {}
+        self.first_pcr = {}
+        self.pes_packets = []
+
+    def on_stream_added(self, program_id: int, pid: int, es: Es):
+        if self.media_types is not None and es.media_type not in self.media_types:
+            return
+        if self.warming_up:
+            self.warmup_streams[pid] = (program_id, es)
+            return
+        self.pid_handlers[pid] = RangePesReader(pid, es, program_id, self)
+
+    def on_stream_removed(self, program_id: int, pid: int, es: Es):
+        self.warmup_streams.pop(pid, None)
+        if isinstance(self.pid_handlers.get(pid), RangePesReader):
+            del self.pid_handlers[pid]
+
+    def on_pes_packet(self, packet: PesPacket):
+        self.pes_packets.append(packet)
+
+    def check_continuity(self, pid: int, continuity_counter: int) -> bool:
+        if pid not in self.continuity_counters:
+            self.first_cc[pid] = continuity_counter
+        return super().check_continuity(pid, continuity_counter)
+
+    def on_adaptation_field(self, pid: int, afield: AdaptationField):
+        if self.warming_up or not afield.has_pcr:
+            return
+        for program_id in self.pcr_pid_programs.get(pid, ()):
+            if program_id not in self.first_pcr:
+                self.first_pcr[program_id] = self.programs_pcr[program_id]
+
+    def end_warmup(self, first_pkt: int):
+        """Start demuxing the range, packets are numbered from first_pkt"""
+        self.warming_up = False
+        for pid, (program_id, es) in self.warmup_streams.items():
+            self.pid_handlers[pid] = RangePesReader(pid, es, program_id, self)
+        self.warmup_streams.clear()
+        if not self.drop_unhandled:
+            self.pid_handlers.set_default_flags(PidTable.FLAG_CC_CHECK)
+        # counters are stitched at range boundaries by the merge
+        self.continuity_counters.clear()
+        self.first_cc.clear()
+        self.continuity_errors = 0
+        self.corrupted_packets = 0
+        self.skipped_bytes = 0
+        self.first_pkt = first_pkt
+        self.pkt_count = first_pkt
+
+    def result(self, index: int, start: int, end: int) -> RangeResult:
+        result = RangeResult(index, start, end)
+        result.pkt_count = self.pkt_count - self.first_pkt
+        result.corrupted_packets = self.corrupted_packets
+        result.continuity_errors = self.continuity_errors
+        result.skipped_bytes = self.skipped_bytes
+        result.first_cc = self.first_cc
+        result.last_cc = dict(self.continuity_counters)
+        result.first_pcr = self.first_pcr
+        result.last_pcr = {program_id: self.programs_pcr[program_id] for program_id in self.first_pcr
+                           if program_id in self.programs_pcr}
+        result.pes_packets = self.pes_packets
+        for pid, reader in self.pid_handlers.items():
+            if not isinstance(reader, RangePesReader):
+                continue
+            if reader.head:
+                result.heads[pid] = reader.head
+            if reader.started:
+                result.started.add(pid)
+            tail = reader.tail()
+            if tail is not None:
+                result.tails[pid] = tail
+        return result
+
+
+def demux_range(demuxer_class, demuxer_kwargs: dict, path: str, index: int, start: int, end: int,
+                origin: int, stride: int, prefix: int) -> RangeResult:
+    """
+    Worker entry point: demux file[start:end], packets are aligned on stride from origin
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        view = memoryview(mm)
+        try:
+            if index == 0:
+                demuxer = demuxer_class(**demuxer_kwargs)
+                demuxer.end_warmup(0)
+            else:
+                # scan back until the pat and all the pmts are complete
+                warmup_pkts = ParallelTsParser.WARMUP_SIZE // stride
+                while True:
+                    warmup_start = max(start - warmup_pkts * stride, origin)
+                    demuxer = demuxer_class(**demuxer_kwargs)
+                    demuxer.sync_locked = True
+                    demuxer.pkt_stride = stride
+                    demuxer.pkt_prefix = prefix
+                    demuxer.stream_offset = warmup_start
+                    demuxer.parse_packets(view[warmup_start:start], start - warmup_start)
+                    if demuxer.psi_complete() or warmup_start == origin:
+                        break
+                    warmup_pkts *= 2
+                demuxer.end_warmup((start - origin) // stride)
+
+            demuxer.parse_packets(view[start:end], end - start, eof=True)
+            return demuxer.result(index, start, end)
+        finally:
+            view.release()
+
+
+class ParallelTsParser(LogEnabled):
+    """
+    Demux a file with a pool of worker processes, each one handling a packet
+    aligned range. Results are merged in file order: continuity counters,
+    pcr and pes packets split at range boundaries are stitched.
+    """
+
+    # size of the ranges demuxed by each worker (~64MB)
+    RANGE_SIZE = TsParser.BLOCK_SIZE * 64
+    # size of the data first scanned back for psi, doubled until complete
+    WARMUP_SIZE = TsParser.BLOCK_SIZE
+
+    def __init__(self, demuxer_class=RangeDemuxer, workers: Optional[int] = None,
+                 range_size: int = RANGE_SIZE, **demuxer_kwargs):
+        """
+        :param demuxer_class: RangeDemuxer subclass, instantiated with demuxer_kwargs in the workers
+        :param workers: number of worker processes, cpu count if None
+        """
+        super().__init__(verbose=demuxer_kwargs.get("verbose", False))
+        self.demuxer_class = demuxer_class
+        self.demuxer_kwargs = demuxer_kwargs
+        self.workers = workers
+        self.range_size = range_size
+        self.pkt_count = 0
+        self.corrupted_packets = 0
+        self.continuity_errors = 0
+        self.skipped_bytes = 0
+        self.continuity_counters = {}
+        self.programs_pcr = {}
+        # pes packets incomplete at the end of the last merged range
+        self.pending = {}
+
+    def on_pes_packet(self, packet: PesPacket):
+        """Called in file order for each pid, packets are not kept"""
+        pass
+
+    def split(self, path: str) -> (list, int, int, int):
+        """
+        :returns ranges (start, end), along with the offset of the first packet, the packet stride and prefix
+        """
+        size = os.path.getsize(path)
+        if size == 0:
+            return [], 0, TsParser.TS_PKT_LEN, 0
+
+        probe = TsParser()
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                origin = probe.acquire_sync(view, 0, size, eof=True)
+            finally:
+                view.release()
+        if not probe.sync_locked:
+            return [(0, size)], 0, TsParser.TS_PKT_LEN, 0
+
+        stride = probe.pkt_stride
+        range_size = max(self.range_size // stride, 1) * stride
+        bounds = list(range(origin + range_size, size, range_size))
+        ranges = list(zip([0] + bounds, bounds + [size]))
+        return ranges, origin, stride, probe.pkt_prefix
+
+    def merge(self, result: RangeResult):
+        for pid, continuity_counter in result.first_cc.items():
+            last = self.continuity_counters.get(pid)
+            if last is not None and continuity_counter != (last + 1) & 0xF:
+                self.warning("continuity check failed for PID 0x%02x at range %d boundary", pid, result.index)
+                self.continuity_errors += 1
+        self.continuity_counters.update(result.last_cc)
+        self.programs_pcr.update(result.last_pcr)
+        self.pkt_count += result.pkt_count
+        self.corrupted_packets += result.corrupted_packets
+        self.continuity_errors += result.continuity_errors
+        self.skipped_bytes += result.skipped_bytes
+
+        # pes packets split at the boundary
+        for pid, head in result.heads.items():
+            partial = self.pending.get(pid)
+            if partial is None:
+                self.warning("dropping data of pid 0x%04x at range %d boundary", pid, result.index)
+                continue
+            for scrambling, data in head:
+                partial.append(scrambling, data)
+                if partial.bounded and partial.data_left == 0:
+                    del self.pending[pid]
+                    self.on_pes_packet(partial.complete())
+                    break
+        for pid in result.started:
+            partial = self.pending.pop(pid, None)
+            if partial is not None:
+                self.on_pes_packet(partial.complete())
+
+        for packet in result.pes_packets:
+            self.on_pes_packet(packet)
+        self.pending.update(result.tails)
+
+    def parse_file(self, path: str):
+        ranges, origin, stride, prefix = self.split(path)
+        self.info("demuxing %d ranges", len(ranges))
+        with ProcessPoolExecutor(self.workers) as executor:
+            # only a few ranges are demuxed ahead of the merge, results are released once merged
+            max_pending = 2 * (self.workers or os.cpu_count() or 1)
+            futures = deque()
+            next_ranges = iter(enumerate(ranges))
+            while True:
+                for index, (start, end) in next_ranges:
+                    futures.append(executor.submit(demux_range, self.demuxer_class, self.demuxer_kwargs, path,
+                                                   index, start, end, origin, stride, prefix))
+                    if len(futures) >= max_pending:
+                        break
+                if not futures:
+                    break
+                self.merge(futures.popleft().result())
+
+        self.info("done")
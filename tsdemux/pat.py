@@ -31,10 +31,10 @@ class PatTableReader(PsiTableReader):
     def on_new_version(self, version: int):
         self.programs = {}
 
-    def on_section(self, section_id: int, data: bytearray, crc32: int) -> bool:
+    def on_section(self, section_id: int, data: memoryview, crc32: int) -> bool:
         data_len = len(data)
         offset = 0
-        self.verbose(f"section {section_id} len: {data_len}")
+        self.verbose("section %d len: %d", section_id, data_len)
 
         if data_len % 4:
             self.error(f"invalid section length {data_len}")
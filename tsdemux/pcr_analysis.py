@@ -0,0 +1,195 @@
+from array import array
+from typing import Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from tsdemux.adaptation_field import AdaptationField
+from tsdemux.demux import TsParser
+
+
+class PcrCollector(TsParser):
+    """Parser collecting the pcr (27MHz) and the offset of the packets carrying them, per program"""
+
+    def __init__(self, verbose=False):
+        super().__init__(verbose=verbose, drop_unhandled=True)
+        # program => (pcr, offsets)
+        self.samples = {}
+
+    def on_adaptation_field(self, pid: int, afield: AdaptationField):
+        if not afield.has_pcr:
+            return
+        for program_id in self.pcr_pid_programs.get(pid, ()):
+            samples = self.samples.get(program_id)
+            if samples is None:
+                samples = self.samples[program_id] = (array('q'), array('Q'))
+            samples[0].append(afield.pcr)
+            samples[1].append(self.pkt_offset)
+
+
+class PcrAnalysis:
+    """
+    Transport bitrate and pcr timing analysis of a program, computed with numpy
+    from its pcr samples (27MHz) and the offsets of the packets carrying them.
+    pcr are unwrapped across the 33 bits base rollover, intervals of more than
+    DISCONTINUITY or going backwards are pcr discontinuities: they split the
+    samples into segments and are excluded from the bitrate and accuracy.
+    Times are in seconds from the first pcr, bitrates in bits/s.
+    """
+
+    PCR_HZ = 27000000
+    PCR_WRAP = (1 << 33) * 300
+    # ETSI TR 101 290 PCR_repetition_error
+    MAX_INTERVAL = 0.04
+    # ETSI TR 101 290 PCR_discontinuity_indicator_error
+    DISCONTINUITY = 0.1
+    # ETSI TR 101 290 PCR_accuracy_error, +/- 500ns
+    MAX_ACCURACY = 500e-9
+    # size of the windows over which the transport rate is assumed constant by accuracy()
+    FIT_WINDOW = 10.0
+
+    def __init__(self, pcr, offsets):
+        if np is None:
+            raise ImportError("numpy is required for pcr analysis")
+        pcr = np.array(pcr, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        if len(pcr) != len(self.offsets):
+            raise ValueError(f"{len(pcr)} pcr for {len(self.offsets)} offsets")
+
+        steps = np.diff(pcr)
+        pcr[1:] += np.cumsum(steps < -self.PCR_WRAP // 2) * self.PCR_WRAP
+        self.pcr = pcr
+        self.intervals = np.diff(pcr) / self.PCR_HZ
+        self.discontinuous = (self.intervals <= 0) | (self.intervals > self.DISCONTINUITY)
+        # continuous time: discontinuous intervals do not count
+        self.times = np.zeros(len(pcr))
+        np.cumsum(np.where(self.discontinuous, 0, self.intervals), out=self.times[1:])
+        self.segments = np.zeros(len(pcr), dtype=np.int64)
+        np.cumsum(self.discontinuous, out=self.segments[1:])
+
+    @classmethod
+    def from_arrays(cls, arrays, program_id: Optional[int] = None) -> "PcrAnalysis":
+        """
+        :param arrays: columns exported by PacketRecorder (dict or loaded .npz)
+        :param program_id: first program if None
+        """
+        programs = arrays["program"]
+        if len(programs) == 0:
+            raise ValueError("no program with a pcr pid")
+        if program_id is None:
+            idx = 0
+        else:
+            matches = np.flatnonzero(programs == program_id)
+            if len(matches) == 0:
+                raise KeyError(program_id)
+            idx = matches[0]
+        pcr_pid = int(arrays["program_pcr_pid"][idx])
+        samples = arrays["pcr_pid"] == pcr_pid
+        return cls(arrays["pcr"][samples], arrays["offset"][arrays["pcr_row"][samples]])
+
+    @classmethod
+    def from_file(cls, path: str, program_id: Optional[int] = None, vectorized: bool = True) -> "PcrAnalysis":
+        """:param program_id: first program if None"""
+        collector = PcrCollector()
+        collector.parse_file(path, vectorized)
+        if not collector.samples:
+            raise ValueError(f"no pcr found in {path}")
+        if program_id is None:
+            program_id = min(collector.samples)
+        pcr, offsets = collector.samples[program_id]
+        return cls(np.frombuffer(pcr, dtype=np.int64), np.frombuffer(offsets, dtype=np.uint64))
+
+    def __len__(self) -> int:
+        return len(self.pcr)
+
+    @property
+    def duration(self) -> float:
+        """continuous time covered by the samples"""
+        return float(self.times[-1]) if len(self.times) else 0.0
+
+    def bitrate(self) -> float:
+        """mean transport bitrate, nan if unknown"""
+        if self.duration <= 0:
+            return float("nan")
+        size = np.diff(self.offsets)[~self.discontinuous].sum()
+        return float(size * 8 / self.duration)
+
+    def instant_bitrate(self) -> "np.ndarray":
+        """:returns transport bitrate between each pcr and the next one, nan across discontinuities"""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            bitrates = np.diff(self.offsets) * 8 / self.intervals
+        bitrates[self.discontinuous] = np.nan
+        return bitrates
+
+    def windowed_bitrate(self, window: float = 1.0) -> "np.ndarray":
+        """
+        :returns transport bitrate over the window ending at each pcr, windows stop at
+                 discontinuities, nan for the first pcr of each segment
+        """
+        # windows never cross a segment boundary once segments are this far apart
+        keys = self.times + self.segments * (self.duration + window + 1)
+        starts = np.searchsorted(keys, keys - window, side="left")
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return (self.offsets - self.offsets[starts]) * 8 / (keys - keys[starts])
+
+    def accuracy(self, fit_window: float = FIT_WINDOW) -> "np.ndarray":
+        """
+        PCR_AC: difference between each pcr and the time its packet should have, given
+        its offset and the transport rate. The rate is fitted on the pcr of fixed windows
+        of fit_window seconds, nan for the windows with less than 3 pcr.
+        :returns accuracy in seconds
+        """
+        if len(self.pcr) == 0:
+            return np.empty(0)
+        # windows never cross a segment boundary
+        windows = (self.times // fit_window).astype(np.int64)
+        new_group = np.empty(len(windows), dtype=bool)
+        new_group[0] = True
+        new_group[1:] = (np.diff(windows) != 0) | (np.diff(self.segments) != 0)
+        groups = np.cumsum(new_group) - 1
+        starts = np.flatnonzero(new_group)
+
+        # least squares of pcr over offset, relative to the first sample of each window
+        x = (self.offsets - self.offsets[starts][groups]).astype(np.float64)
+        y = (self.pcr - self.pcr[starts][groups]).astype(np.float64)
+        n = np.bincount(groups)
+        sx = np.bincount(groups, x)
+        sy = np.bincount(groups, y)
+        sxx = np.bincount(groups, x * x)
+        sxy = np.bincount(groups, x * y)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            slope = (n * sxy - sx * sy) / (n * sxx - sx * sx)
+            intercept = (sy - slope * sx) / n
+        slope[n < 3] = np.nan
+        return (y - (intercept[groups] + slope[groups] * x)) / self.PCR_HZ
+
+    def interval_violations(self, max_interval: float = MAX_INTERVAL) -> "np.ndarray":
+        """:returns indices of the pcr following an interval longer than max_interval"""
+        return np.flatnonzero(self.intervals > max_interval) + 1
+
+    def discontinuities(self) -> "np.ndarray":
+        """:returns indices of the pcr starting a new segment"""
+        return np.flatnonzero(self.discontinuous) + 1
+
+    def report(self, window: float = 1.0, fit_window: float = FIT_WINDOW, max_interval: float = MAX_INTERVAL,
+               max_accuracy: float = MAX_ACCURACY) -> dict:
+        """Summary of the analysis, accuracy and intervals in seconds"""
+        windowed = self.windowed_bitrate(window)
+        windowed = windowed[np.isfinite(windowed)]
+        accuracy = self.accuracy(fit_window)
+        accuracy = np.abs(accuracy[np.isfinite(accuracy)])
+        intervals = self.intervals[~self.discontinuous]
+        return {
+            "pcr": len(self.pcr),
+            "duration": self.duration,
+            "bitrate": self.bitrate(),
+            "min_bitrate": float(windowed.min()) if len(windowed) else float("nan"),
+            "max_bitrate": float(windowed.max()) if len(windowed) else float("nan"),
+            "max_accuracy": float(accuracy.max()) if len(accuracy) else float("nan"),
+            "accuracy_errors": int((accuracy > max_accuracy).sum()),
+            "max_interval": float(intervals.max()) if len(intervals) else float("nan"),
+            "interval_violations": len(self.interval_violations(max_interval)),
+            "discontinuities": int(self.discontinuous.sum()),
+        }
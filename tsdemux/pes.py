@@ -1,3 +1,4 @@
+import struct
 from abc import abstractmethod
 from typing import Any
 
@@ -6,17 +7,173 @@ from tsdemux.logger import LogEnabled
 from tsdemux.reader import TsReader
 
 
+class PesHeader:
+    """
+    Fixed part of a pes packet header followed by its optional timestamps,
+    in 90kHz ticks (27MHz for escr), -1 when absent
+    """
+
+    __slots__ = ("stream_id", "packet_len", "flags", "header_len", "pts", "dts", "escr")
+
+    # start code, stream_id, packet_len, flags, header_len
+    FIXED = struct.Struct(">3xBHHB")
+    FIXED_LEN = FIXED.size
+    # 33 bits pts/dts with markers
+    TIMESTAMP = struct.Struct(">BHH")
+    # 33 bits escr base and 9 bits extension with markers
+    ESCR = struct.Struct(">HI")
+
+    FLAG_PTS = 0x80
+    FLAG_DTS = 0x40
+    FLAG_ESCR = 0x20
+
+    def __init__(self, data):
+        self.stream_id, self.packet_len, self.flags, self.header_len = self.FIXED.unpack_from(data)
+        offset = self.FIXED_LEN
+        self.pts = self.dts = self.escr = -1
+        flags = self.flags
+        if flags & self.FLAG_PTS:
+            self.pts = self.read_timestamp(data, offset)
+            offset += 5
+            if flags & self.FLAG_DTS:
+                # cannot have dts without pts
+                self.dts = self.read_timestamp(data, offset)
+                offset += 5
+        if flags & self.FLAG_ESCR and len(data) >= offset + 6:
+            high, low = self.ESCR.unpack_from(data, offset)
+            base = ((high & 0x3800) << 19) | ((high & 0x3FF) << 20) | ((low & 0xF8000000) >> 12) \
+                | ((low & 0x3FFF800) >> 11)
+            self.escr = base * 300 + ((low >> 1) & 0x1FF)
+
+    @classmethod
+    def read_timestamp(cls, data, offset: int) -> int:
+        """:returns 33 bits pts/dts at offset, in 90kHz ticks"""
+        a, bc, de = cls.TIMESTAMP.unpack_from(data, offset)
+        return ((a & 0x0E) << 29) | ((bc >> 1) << 15) | (de >> 1)
+
+    @property
+    def valid(self) -> bool:
+        """marker bits of the optional header"""
+        return (self.flags & 0xC000) == 0x8000
+
+    @property
+    def data_offset(self) -> int:
+        """offset of the payload from the start code"""
+        return self.FIXED_LEN + self.header_len
+
+    def __str__(self):
+        return "[PES|stream_id:0x%02x] packet len: %d PTS: %d, DTS: %d, header len: %d" % (
+            self.stream_id, self.packet_len, self.pts, self.dts, self.header_len)
+
+
+class PesPacket:
+    """Complete pes packet delivered by AsyncTsDemuxer and ParallelTsParser"""
+
+    def __init__(self, program_id: int, pid: int, es: Es, pts: float, dts: float, scrambled: bool, data: bytes):
+        self.program_id = program_id
+        self.pid = pid
+        self.es = es
+        self.pts = pts
+        self.dts = dts
+        self.scrambled = scrambled
+        self.data = data
+
+    def __str__(self):
+        return f"[PES:0x{self.pid:04x}] pts: {self.pts} dts: {self.dts} len: {len(self.data)}"
+
+
+class H264KeyframeScanner:
+    """
+    Tells if an H264 pes packet is a keyframe from the type of its first slice NAL unit,
+    access unit delimiter, sps, pps and sei NAL units may push it past the first ts packet
+    """
+
+    __slots__ = ("pending", "tail")
+
+    START_CODE = b'\x00\x00\x01'
+    # coded slices: non IDR (1), data partitions (2-4), IDR (5)
+    NAL_SLICE_FIRST = 1
+    NAL_IDR = 5
+
+    def __init__(self):
+        # the first slice of the current pes packet was not found yet
+        self.pending = False
+        # last bytes of the previous payload, a start code may span two ts packets
+        self.tail = b""
+
+    def start(self):
+        self.pending = True
+        self.tail = b""
+
+    def scan(self, data) -> bool:
+        """
+        Scan the next payload of the pes packet, pending is cleared once its first slice is found
+        :returns True if the first slice is an IDR slice
+        """
+        data = self.tail + bytes(data)
+        pos = data.find(self.START_CODE)
+        while 0 <= pos < len(data) - 3:
+            nal_type = data[pos + 3] & 0x1F
+            if self.NAL_SLICE_FIRST <= nal_type <= self.NAL_IDR:
+                self.pending = False
+                return nal_type == self.NAL_IDR
+            pos = data.find(self.START_CODE, pos + 3)
+        self.tail = data[-3:]
+        return False
+
+
 class PesReader(LogEnabled, TsReader):
 
     class Section:
-        def __init__(self, data=None, scrambling: int = 0):
-            if data is None:
-                self.data = bytearray()
-            else:
-                self.data = data
-            self.scrambling = scrambling
+        """
+        PES payload sharing the same scrambling control. Data is either written
+        in a preallocated buffer when the payload size is known, or collected
+        as a list of chunks joined only once, when data is first accessed.
+        data is the only accessor of the payload: buffer and chunks are storage
+        details, chunks stay empty while the buffer is used.
+        """
+
+        __slots__ = ("scrambling", "chunks", "buffer", "size", "joined")
 
-    def __init__(self, pid: int, es: Es):
+        def __init__(self, data=None, scrambling: int = 0, buffer: bytearray = None):
+            self.scrambling = scrambling
+            self.chunks = []
+            self.buffer = buffer
+            self.size = 0
+            self.joined = None
+            if data is not None:
+                self.append(data)
+
+        def append(self, data):
+            data_len = len(data)
+            if self.buffer is not None:
+                if self.size + data_len <= len(self.buffer):
+                    self.buffer[self.size:self.size + data_len] = data
+                    self.size += data_len
+                    self.joined = None
+                    return
+                # size hint was wrong, fallback to chunks
+                self.chunks.append(bytes(self.buffer[:self.size]))
+                self.buffer = None
+            self.chunks.append(bytes(data))
+            self.size += data_len
+            self.joined = None
+
+        @property
+        def data(self):
+            if self.joined is None:
+                if self.buffer is not None:
+                    self.joined = memoryview(self.buffer)[:self.size]
+                elif len(self.chunks) == 1:
+                    self.joined = self.chunks[0]
+                else:
+                    self.joined = b"".join(self.chunks)
+            return self.joined
+
+    def __init__(self, pid: int, es: Es, keyframes_only: bool = False):
+        """
+        :param keyframes_only: trick play, only reassemble the pes packets of random access points
+        """
         super().__init__()
         self.log_prefix = f"{es.name} "
         self.pid = pid
@@ -25,19 +182,42 @@ class PesReader(LogEnabled, TsReader):
         self.data_left = 0
         self.pts = -1
         self.dts = -1
+        # header of the current pes packet
+        self.header: Any[None, PesHeader] = None
         self.cur_section: Any[None, PesReader.Section] = None
         self.sections = None
+        # reused for the payload of pes packets with a known size
+        self.buffer = bytearray()
+        self.keyframes_only = keyframes_only
+        # random_access_indicator of the ts packet starting the current pes packet
+        self.random_access = False
+        # the first slice of the current H264 pes packet is an IDR slice, only looked
+        # for with keyframes_only when the random access indicator is not set
+        self.idr = False
+        self.idr_scanner = H264KeyframeScanner()
+        # payload of the current pes packet is ignored (keyframes_only)
+        self.skipping = False
 
     @abstractmethod
     def on_pes_packet_complete(self):
-        """Process complete pes packet"""
+        """
+        Process complete pes packet from self.sections. Each section provides
+        its payload as a single buffer (data), only valid during the call.
+        """
         pass
 
     def process_pes_packet(self):
         if self.cur_section is None:
             return
 
-        if len(self.cur_section.data) != 0:
+        if self.idr_scanner.pending:
+            # no slice in the whole pes packet, not a keyframe
+            self.idr_scanner.pending = False
+            self.cur_section = None
+            self.sections = None
+            return
+
+        if self.cur_section.size != 0:
             self.sections.append(self.cur_section)
             self.cur_section = None
 
@@ -62,39 +242,61 @@ class PesReader(LogEnabled, TsReader):
             return
 
         if self.cur_section.scrambling != scrambling:
-            self.verbose(f"need a new section scrambling {self.cur_section.scrambling} => {scrambling}")
-            if len(self.cur_section.data) > 0:
+            self.verbose("need a new section scrambling %d => %d", self.cur_section.scrambling, scrambling)
+            if self.cur_section.size > 0:
                 self.sections.append(self.cur_section)
             self.cur_section = self.Section(scrambling=scrambling)
 
         if self.pes_packet_len > 0 and data_len >= self.data_left:
             if data_len > self.data_left:
                 self.warning(f"adding too much data: {data_len} vs {self.data_left}")
-            self.cur_section.data += data
+            self.cur_section.append(data)
             self.data_left = 0
             self.process_pes_packet()
         else:
-            self.cur_section.data += data
+            self.cur_section.append(data)
             self.data_left -= data_len
 
+    def drop_partial(self):
+        # skip payload until the next pes packet start
+        self.cur_section = None
+        self.sections = None
+        self.pes_packet_len = 0
+        self.data_left = 0
+        self.skipping = True
+        self.idr_scanner.pending = False
+
+    def update_es(self, es: Es) -> bool:
+        """
+        Called when a new pmt version changes the descriptors of the stream
+        :returns True if the reader can go on with es, keeping its reassembly state
+        """
+        if es.stream_type != self.es.stream_type or es.priv_stream_type != self.es.priv_stream_type:
+            return False
+        self.es = es
+        self.log_prefix = f"{es.name} "
+        return True
+
+    @property
+    def keyframe(self) -> bool:
+        return self.random_access or self.idr
+
     @staticmethod
     def read_pts(data: bytearray, offset: int) -> float:
         """
         Read the 33bits timestamp and return convert to a timestamp value in ms
         """
-        a = data[offset] & 0x0E
-        b = data[offset + 1] & 0xFF
-        c = data[offset + 2] & 0xFF
-        d = data[offset + 3] & 0xFF
-        e = data[offset + 4] & 0xFF
+        return PesHeader.read_timestamp(data, offset) / 90
 
-        return (((a & 0x0E) << 29) |
-                (((((b << 8) | c) & 0xFFFF) >> 1) << 15) |
-                ((((d << 8) | e) & 0xFFFF) >> 1)) / 90
-
-    def read_payload(self, data: bytearray, pusi: bool, scrambling: int, discontinuity: bool):
+    def read_payload(self, data: bytearray, pusi: bool, scrambling: int, discontinuity: bool,
+                     random_access: bool = False):
         if not pusi:
-            self.append_data(data, scrambling)
+            if self.idr_scanner.pending and scrambling == 0:
+                self.idr = self.idr_scanner.scan(data)
+                if not self.idr and not self.idr_scanner.pending:
+                    self.drop_partial()
+            if not self.skipping:
+                self.append_data(data, scrambling)
             return
 
         if self.sections is not None and self.pes_packet_len > 0 and self.data_left > 0:
@@ -102,61 +304,56 @@ class PesReader(LogEnabled, TsReader):
 
         # process prev packet
         self.process_pes_packet()
+        self.skipping = False
+        self.random_access = random_access
+        self.idr = False
+        self.idr_scanner.pending = False
 
         # check start code
         if data[0:3] != b'\x00\x00\x01':
             self.warning(f"bad start code 0x{data[0:3].hex()}")
             return
 
-        # skip pes start code
-        offset = 3
-        data_len = len(data) - 3
-
         # process headers
-        stream_id = data[offset] & 0xFF
-        offset += 1
-        packet_len = ((data[offset] & 0xFF) << 8) | (data[offset + 1] & 0xFF)
-        offset += 2
+        header = self.header = PesHeader(data)
+        packet_len = header.packet_len
 
-        self.verbose(f"stream_id: {stream_id}, packet_len: {packet_len}")
+        self.verbose("stream_id: %d, packet_len: %d", header.stream_id, packet_len)
 
         # new pes packet
         self.sections = []
-        self.cur_section = self.Section(scrambling=scrambling)
 
-        # skip some flags
-        if (data[offset] & 0xC0) != 0x80:
+        if not header.valid:
             self.warning("invalid marker bytes")
-        offset += 1
-
-        has_pts = (data[offset] & 0x80) != 0
-        has_dts = (data[offset] & 0x40) != 0
-        offset += 1
 
-        # read header length
-        header_len = data[offset]
-        offset += 1
-
-        data_len -= 6 + header_len
+        offset = header.data_offset
+        data_len = len(data) - offset
         if packet_len > 0:
-            packet_len -= 3 + header_len
-
-        if has_pts:
-            self.pts = self.read_pts(data, offset)
+            packet_len -= 3 + header.header_len
+            if len(self.buffer) < packet_len:
+                self.buffer = bytearray(packet_len)
+            self.cur_section = self.Section(scrambling=scrambling, buffer=self.buffer)
         else:
-            self.pts = 0
+            self.cur_section = self.Section(scrambling=scrambling)
 
-        if has_dts:
-            # cannot have dts without pts
-            self.dts = self.read_pts(data, offset + 5)
-        else:
-            self.dts = 0
+        self.pts = header.pts / 90 if header.pts >= 0 else 0
+        self.dts = header.dts / 90 if header.dts >= 0 else 0
 
+        self.pes_packet_len = packet_len
         self.data_left = packet_len
 
-        self.verbose(f"[PES] packet len: {self.pes_packet_len} "
-                     f"PTS: {self.pts}, DTS: {self.dts}, header len: {header_len}")
-        # skip rest of header
-        offset += header_len
+        self.verbose("[PES] packet len: %d PTS: %s, DTS: %s, header len: %d",
+                     self.pes_packet_len, self.pts, self.dts, header.header_len)
+
+        if self.keyframes_only and not random_access and self.es.stream_type == Es.STREAM_TYPE_H264 \
+                and scrambling == 0:
+            self.idr_scanner.start()
+            self.idr = self.idr_scanner.scan(data[offset:offset+data_len])
+
+        if self.keyframes_only and not self.keyframe and not self.idr_scanner.pending:
+            self.skipping = True
+            self.cur_section = None
+            self.sections = None
+            return
 
         self.append_data(data[offset:offset+data_len], scrambling=scrambling)
@@ -0,0 +1,119 @@
+from array import array
+
+from tsdemux.reader import TsReader
+
+
+class PidTable:
+    """
+    Fixed size table indexed by pid holding the handler and the processing
+    flags of every pid. It behaves like a dict of pid => handler so handlers
+    can be added and removed at any time.
+    """
+
+    NB_PIDS = 0x2000
+
+    # reject packets right after pid extraction
+    FLAG_DROP = 0x01
+    # only count packets, see counts
+    FLAG_COUNT_ONLY = 0x02
+    # check continuity counters
+    FLAG_CC_CHECK = 0x04
+    # pid carries the pcr of at least one program
+    FLAG_PCR = 0x08
+    # a handler is registered for the pid
+    FLAG_HANDLER = 0x10
+    # decode the adaptation field of every packet of the pid
+    FLAG_AFIELD = 0x20
+
+    def __init__(self, default_flags: int = FLAG_CC_CHECK):
+        self.default_flags = default_flags
+        self.handlers = [None] * self.NB_PIDS
+        self.flags = bytearray([default_flags]) * self.NB_PIDS
+        self.counts = array('Q', [0]) * self.NB_PIDS
+        self.pids = set()
+        # incremented each time a handler is added or removed, or flags change
+        self.version = 0
+
+    def add_handler(self, pid: int, handler: TsReader, flags: int = FLAG_CC_CHECK):
+        self.handlers[pid] = handler
+        self.flags[pid] = (flags & ~self.FLAG_DROP) | self.FLAG_HANDLER | (self.flags[pid] & self.FLAG_PCR)
+        self.pids.add(pid)
+        self.version += 1
+
+    def remove_handler(self, pid: int):
+        if self.handlers[pid] is None:
+            raise KeyError(pid)
+        self.handlers[pid] = None
+        self.pids.discard(pid)
+        if self.flags[pid] & self.FLAG_PCR:
+            self.flags[pid] = (self.default_flags | self.FLAG_PCR) & ~self.FLAG_DROP
+        else:
+            self.flags[pid] = self.default_flags
+        self.version += 1
+
+    def set_default_flags(self, default_flags: int):
+        """Change the flags of all the pids without handler"""
+        for pid in range(self.NB_PIDS):
+            if self.handlers[pid] is not None:
+                continue
+            if self.flags[pid] & self.FLAG_PCR:
+                self.flags[pid] = (default_flags | self.FLAG_PCR) & ~self.FLAG_DROP
+            else:
+                self.flags[pid] = default_flags
+        self.default_flags = default_flags
+        self.version += 1
+
+    # flags maintained by the table itself, kept by set_flags()
+    INTERNAL_FLAGS = FLAG_HANDLER | FLAG_PCR
+
+    def set_flags(self, pid: int, flags: int):
+        """Set the processing flags of a pid, FLAG_HANDLER and FLAG_PCR are kept as they are"""
+        internal = self.flags[pid] & self.INTERNAL_FLAGS
+        if internal:
+            # pids with a handler or carrying a pcr are never dropped
+            flags &= ~self.FLAG_DROP
+        self.flags[pid] = (flags & ~self.INTERNAL_FLAGS) | internal
+        self.version += 1
+
+    def set_pcr(self, pid: int, pcr: bool):
+        if pcr:
+            self.flags[pid] = (self.flags[pid] | self.FLAG_PCR) & ~self.FLAG_DROP
+        else:
+            self.flags[pid] &= ~self.FLAG_PCR
+            if self.handlers[pid] is None:
+                self.flags[pid] |= self.default_flags & self.FLAG_DROP
+        self.version += 1
+
+    def get(self, pid: int, default=None):
+        handler = self.handlers[pid]
+        return default if handler is None else handler
+
+    def keys(self):
+        return set(self.pids)
+
+    def values(self):
+        return [self.handlers[pid] for pid in self.pids]
+
+    def items(self):
+        return [(pid, self.handlers[pid]) for pid in self.pids]
+
+    def __getitem__(self, pid: int) -> TsReader:
+        handler = self.handlers[pid]
+        if handler is None:
+            raise KeyError(pid)
+        return handler
+
+    def __setitem__(self, pid: int, handler: TsReader):
+        self.add_handler(pid, handler)
+
+    def __delitem__(self, pid: int):
+        self.remove_handler(pid)
+
+    def __contains__(self, pid) -> bool:
+        return pid in self.pids
+
+    def __iter__(self):
+        return iter(list(self.pids))
+
+    def __len__(self) -> int:
+        return len(self.pids)
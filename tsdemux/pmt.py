@@ -9,7 +9,12 @@ class PmtTableReader(PsiTableReader):
     def __init__(self, pid, program_id,
                  on_pcr_pid_changed: Callable[[int, int], None],
                  on_stream_added: Callable[[int, int, Es], None],
-                 on_stream_removed: Callable[[int, int, Es], None]):
+                 on_stream_removed: Callable[[int, int, Es], None],
+                 on_stream_updated: Callable[[int, int, Es, Es], None] = None):
+        """
+        :param on_stream_updated: called with the previous and new es when a stream
+                                  changes, otherwise it is removed and added again
+        """
         super().__init__(pid, PsiTableReader.TABLE_ID_PMT)
         self.log_prefix = f"[PMT:0x{self.pid:04x}] "
         self.program_id = program_id
@@ -19,6 +24,7 @@ class PmtTableReader(PsiTableReader):
         self.on_pcr_pid_changed = on_pcr_pid_changed
         self.on_stream_added = on_stream_added
         self.on_stream_removed = on_stream_removed
+        self.on_stream_updated = on_stream_updated
 
     def check_section_headers(self, table_id: int, section_length: int, ext_id: int) -> bool:
         # additional checks
@@ -39,7 +45,7 @@ class PmtTableReader(PsiTableReader):
     def on_new_version(self, version: int):
         self.streams = {}
 
-    def on_section(self, section_id: int, data: bytearray, crc32: int) -> bool:
+    def on_section(self, section_id: int, data: memoryview, crc32: int) -> bool:
         offset = 0
         data_len = len(data)
 
@@ -47,7 +53,7 @@ class PmtTableReader(PsiTableReader):
             self.warning(f"section id should be 0, got {section_id}")
             return False
 
-        self.verbose(f"section {section_id} len: {data_len}")
+        self.verbose("section %d len: %d", section_id, data_len)
         if data_len < 4:
             self.error(f"section length should not be < 4 bytes, got {data_len}")
             return False
@@ -73,7 +79,7 @@ class PmtTableReader(PsiTableReader):
             self.error(f"info len out of bounds {program_info_len} vs {data_len}")
             return False
 
-        self.verbose(f"program_info_len: {program_info_len}")
+        self.verbose("program_info_len: %d", program_info_len)
         # read program info
         if program_info_len > 0:
             # TODO: parse
@@ -100,7 +106,7 @@ class PmtTableReader(PsiTableReader):
                 self.error(f"info_len out of bounds {info_len} vs {data_len}")
                 return False
 
-            self.streams[es_pid] = Es(es_pid, stream_type, data[offset:offset+info_len])
+            self.streams[es_pid] = Es(es_pid, stream_type, bytes(data[offset:offset+info_len]))
 
             if info_len > 0:
                 offset += info_len
@@ -130,8 +136,11 @@ class PmtTableReader(PsiTableReader):
             es = self.streams[pid]
             if prev_es != es:
                 self.info(f'  [U] pid: 0x{pid:04x} => es changed from {prev_es} to {es}')
-                self.on_stream_removed(self.program_id, pid, self.prev_streams[pid])
-                self.on_stream_added(self.program_id, pid, self.streams[pid])
+                if self.on_stream_updated is not None:
+                    self.on_stream_updated(self.program_id, pid, prev_es, es)
+                else:
+                    self.on_stream_removed(self.program_id, pid, prev_es)
+                    self.on_stream_added(self.program_id, pid, es)
 
         self.prev_streams = self.streams.copy()
 
@@ -22,23 +22,37 @@ class PsiTableReader(LogEnabled, TsReader):
         self.current_version = -1
         self.last_section = -1
         self.sections_crc = {}
+        # raw bytes of the last section with a valid crc, per section number
+        self.verified_sections = {}
+        # raw bytes of the sections of the current version, see replay()
+        self.raw_sections = {}
         self.table_complete = False
+        # sections are assembled in place, only the tail left after parsing is moved
+        self.payload = bytearray(self.MAX_TABLE_SIZE)
+        self.payload_view = memoryview(self.payload)
         self.payload_len = 0
-        self.payload = None
+        self.section_started = False
 
     def reset(self):
         self.current_version = -1
         self.last_section = -1
         self.sections_crc.clear()
+        self.verified_sections.clear()
+        self.raw_sections.clear()
         self.table_complete = False
         self.payload_len = 0
-        self.payload = None
+        self.section_started = False
+
+    def drop_partial(self):
+        self.payload_len = 0
+        self.section_started = False
 
     def handle_new_version(self, version):
         self.on_new_version(version)
         self.current_version = version
         self.last_section = -1
         self.sections_crc.clear()
+        self.raw_sections.clear()
         self.table_complete = False
 
     @abstractmethod
@@ -47,9 +61,9 @@ class PsiTableReader(LogEnabled, TsReader):
         pass
 
     @abstractmethod
-    def on_section(self, section_id: int, data: bytearray, crc32: int) -> bool:
+    def on_section(self, section_id: int, data: memoryview, crc32: int) -> bool:
         """
-        Called when a new section has been received
+        Called when a new section has been received, data is only valid during the call
         :returns True if section is valid
         """
         pass
@@ -67,7 +81,7 @@ class PsiTableReader(LogEnabled, TsReader):
 
     def push_data(self, data: bytearray):
         """Accumulate data in section payload buffer"""
-        if self.payload is None:
+        if not self.section_started:
             self.warning("drop data, pusi not seen yet")
             return
 
@@ -78,12 +92,11 @@ class PsiTableReader(LogEnabled, TsReader):
             self.reset()
             return
 
-        self.payload += data
+        self.payload[self.payload_len:self.payload_len + data_len] = data
         self.payload_len += data_len
 
     def parse_section(self, offset: int, section_length: int) -> bool:
-        start = offset
-        data = self.payload[offset:offset+section_length+3]
+        data = self.payload_view[offset:offset+section_length+3]
         table_id = self.payload[offset] & 0xFF
         section_syntax_indicator = self.payload[offset + 1] & 0x80 != 0
         private_indicator = self.payload[offset + 1] & 0x40 != 0
@@ -116,11 +129,13 @@ class PsiTableReader(LogEnabled, TsReader):
         last_section = self.payload[offset] & 0xFF
         offset += 1
 
-        # check crc32
-        crc = Crc32.compute(self.payload[start:start + section_length + 3])
-        if crc != 0:
-            self.error(f"invalid crc: got {crc}")
-            return True
+        # check crc32, unless the section is identical to the last verified one
+        if self.verified_sections.get(cur_section) != data:
+            crc = Crc32.compute(data)
+            if crc != 0:
+                self.error(f"invalid crc: got {crc}")
+                return True
+            self.verified_sections[cur_section] = bytes(data)
 
         if not self.check_section_headers(table_id, section_length, ext_id):
             self.error("invalid headers")
@@ -136,7 +151,7 @@ class PsiTableReader(LogEnabled, TsReader):
             return True
 
         if version != self.current_version:
-            self.verbose(f"received a new version ({version} was {self.current_version}) of table {self.table_id}")
+            self.verbose("received a new version (%d was %d) of table %d", version, self.current_version, self.table_id)
             self.handle_new_version(version)
 
         if cur_section > last_section:
@@ -160,17 +175,18 @@ class PsiTableReader(LogEnabled, TsReader):
 
         payload_length = section_length - 5 - 4
 
-        self.verbose(f"received section {cur_section} / {last_section} of table_id {table_id}")
+        self.verbose("received section %d / %d of table_id %d", cur_section, last_section, table_id)
 
-        if self.on_section(cur_section, self.payload[offset: offset+payload_length], crc32):
+        if self.on_section(cur_section, self.payload_view[offset: offset+payload_length], crc32):
             self.sections_crc[cur_section] = crc32
+            self.raw_sections[cur_section] = bytes(data)
 
         if not self.table_complete and len(self.sections_crc.keys()) == self.last_section + 1:
-            self.verbose(f"table {table_id} is complete")
+            self.verbose("table %d is complete", table_id)
             self.on_table_complete()
             self.table_complete = True
         else:
-            self.verbose(f"table not complete {len(self.sections_crc.keys())} / {self.last_section}")
+            self.verbose("table not complete %d / %d", len(self.sections_crc), self.last_section)
 
         return True
 
@@ -192,7 +208,7 @@ class PsiTableReader(LogEnabled, TsReader):
                 self.verbose("section not complete (%d vs %d)", left - 3, section_length)
                 break
 
-            self.verbose(f"section_length {section_length}")
+            self.verbose("section_length %d", section_length)
 
             if not self.parse_section(offset, section_length):
                 break
@@ -202,13 +218,21 @@ class PsiTableReader(LogEnabled, TsReader):
             first = False
 
         if left > 0:
-            self.debug(f"left after parse: {left}")
+            self.debug("left after parse: %d", left)
 
-        if left > 0 and left != self.payload_len:
-            self.payload = self.payload[offset:offset+left]
+        if left != self.payload_len:
+            # move the incomplete section to the start of the buffer
+            if left > 0:
+                self.payload_view[:left] = self.payload_view[offset:offset+left]
             self.payload_len = left
 
-    def read_payload(self, data: bytearray, pusi: bool, scrambled: int, discontinuity: bool):
+    def replay(self, sections: list):
+        """Parse raw sections again, ex: restored from a snapshot of another parser"""
+        for section in sections:
+            self.read_payload(b"\x00" + section, True, 0, False)
+
+    def read_payload(self, data: bytearray, pusi: bool, scrambled: int, discontinuity: bool,
+                     random_access: bool = False):
 
         if discontinuity:
             self.reset()
@@ -227,7 +251,7 @@ class PsiTableReader(LogEnabled, TsReader):
         pointer_field = data[offset]
         offset += 1
 
-        self.verbose(f"pointer_field: {pointer_field}")
+        self.verbose("pointer_field: %d", pointer_field)
 
         if pointer_field >= data_len:
             self.error(f"pointer_field out of packet {pointer_field} vs {data_len}")
@@ -246,7 +270,7 @@ class PsiTableReader(LogEnabled, TsReader):
 
         # start new section
         self.payload_len = 0
-        self.payload = bytearray()
+        self.section_started = True
 
         if (data[offset] & 0xFF) == 0xFF:
             self.warning("only padding found in table")
@@ -0,0 +1,81 @@
+import queue
+import threading
+
+
+class ReadAheadReader(threading.Thread):
+    """
+    Fill a ring of buffers from a stream in a background thread, so reads
+    (which release the GIL) overlap with parsing. Filled buffers are handed
+    out in order with get() and must be given back with release().
+    """
+
+    # wait before reading again a non blocking stream without data available
+    POLL_INTERVAL = 0.01
+    # wait for the thread to leave the stream in stop()
+    STOP_TIMEOUT = 1.0
+
+    def __init__(self, stream, block_size: int, nb_buffers: int = 3):
+        super().__init__(name="ts-read-ahead", daemon=True)
+        self.stream = stream
+        self.block_size = block_size
+        self.free = queue.Queue()
+        self.filled = queue.Queue()
+        self.stopped = threading.Event()
+        for _ in range(nb_buffers):
+            self.free.put(bytearray(block_size))
+
+    def run(self):
+        readinto = getattr(self.stream, "readinto", None)
+        try:
+            while True:
+                buf = self.free.get()
+                if buf is None or self.stopped.is_set():
+                    return
+                read_len = self.read(readinto, buf)
+                if read_len is None:
+                    return
+                self.filled.put((buf, read_len))
+                if not read_len:
+                    return
+        except Exception as e:
+            self.filled.put((None, e))
+
+    def read(self, readinto, buf: bytearray):
+        """:returns the number of bytes read in buf, 0 at end of stream, None if stopped"""
+        while not self.stopped.is_set():
+            if readinto is not None:
+                read_len = readinto(buf)
+            else:
+                chunk = self.stream.read(self.block_size)
+                read_len = None if chunk is None else len(chunk)
+                if read_len:
+                    buf[:read_len] = chunk
+            # None: no data available yet on a non blocking stream, not the end of stream
+            if read_len is not None:
+                return read_len
+            self.stopped.wait(self.POLL_INTERVAL)
+        return None
+
+    def get(self) -> (bytearray, int):
+        """
+        Wait for the next filled buffer
+        :returns the buffer and the number of bytes read, 0 at end of stream
+        """
+        buf, read_len = self.filled.get()
+        if buf is None:
+            raise read_len
+        return buf, read_len
+
+    def release(self, buf: bytearray):
+        """Give a buffer back to be filled again"""
+        self.free.put(buf)
+
+    def stop(self, timeout: float = STOP_TIMEOUT):
+        """
+        Stop reading and wait for the thread to leave the stream, a read blocked
+        for more than timeout is abandoned to the daemon thread
+        """
+        self.stopped.set()
+        self.free.put(None)
+        if self.is_alive():
+            self.join(timeout)
@@ -3,5 +3,10 @@ from abc import abstractmethod
 
 class TsReader:
     @abstractmethod
-    def read_payload(self, data: bytearray, pusi: bool, scrambled: int, discontinuity: bool):
+    def read_payload(self, data: bytearray, pusi: bool, scrambled: int, discontinuity: bool,
+                     random_access: bool = False):
+        pass
+
+    def drop_partial(self):
+        """Drop the partially received payload, the input jumped to another position"""
         pass
@@ -0,0 +1,170 @@
+import struct
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from tsdemux.adaptation_field import AdaptationField
+from tsdemux.demux import TsParser
+from tsdemux.packet import TsPacket
+from tsdemux.pes import PesHeader
+from tsdemux.pid_table import PidTable
+from tsdemux.vectorized import PacketHeaders
+
+
+class PacketColumns:
+    """
+    Per packet metadata stored column wise in typed arrays: one row per packet,
+    pcr and pes header samples refer to the row of the packet carrying them.
+    pcr are in 27MHz units, pts and dts in 90kHz ticks (-1 if absent).
+    """
+
+    PACKET_COLUMNS = (("offset", "Q"), ("pid", "H"), ("cc", "B"), ("pusi", "B"), ("scrambling", "B"),
+                      ("discontinuity", "B"))
+    PCR_COLUMNS = (("pcr_row", "Q"), ("pcr_pid", "H"), ("pcr", "q"))
+    PES_COLUMNS = (("pes_row", "Q"), ("pes_pid", "H"), ("pts", "q"), ("dts", "q"))
+    COLUMNS = PACKET_COLUMNS + PCR_COLUMNS + PES_COLUMNS
+
+    def __init__(self):
+        self.columns = {name: array(typecode) for name, typecode in self.COLUMNS}
+        self.offset = self.columns["offset"]
+        self.pid = self.columns["pid"]
+        self.cc = self.columns["cc"]
+        self.pusi = self.columns["pusi"]
+        self.scrambling = self.columns["scrambling"]
+        self.discontinuity = self.columns["discontinuity"]
+
+    def __len__(self) -> int:
+        return len(self.offset)
+
+    def add(self, offset: int, pid: int, cc: int, pusi: bool, scrambling: int, discontinuity: bool):
+        self.offset.append(offset)
+        self.pid.append(pid)
+        self.cc.append(cc)
+        self.pusi.append(pusi)
+        self.scrambling.append(scrambling)
+        self.discontinuity.append(discontinuity)
+
+    def add_pcr(self, row: int, pid: int, pcr: int):
+        columns = self.columns
+        columns["pcr_row"].append(row)
+        columns["pcr_pid"].append(pid)
+        columns["pcr"].append(pcr)
+
+    def add_pes(self, row: int, pid: int, pts: int, dts: int):
+        columns = self.columns
+        columns["pes_row"].append(row)
+        columns["pes_pid"].append(pid)
+        columns["pts"].append(pts)
+        columns["dts"].append(dts)
+
+    def extend(self, **values):
+        """Append numpy arrays to the columns, by name"""
+        columns = self.columns
+        for name, value in values.items():
+            column = columns[name]
+            column.frombytes(np.ascontiguousarray(value, dtype=column.typecode).tobytes())
+
+    def arrays(self) -> dict:
+        """:returns a copy of the columns as numpy arrays, by name"""
+        if np is None:
+            raise ImportError("numpy is required to export packet columns")
+        return {name: np.frombuffer(column, dtype=column.typecode).copy() if column else
+                np.empty(0, dtype=column.typecode) for name, column in self.columns.items()}
+
+
+class PacketRecorder(TsParser):
+    """
+    Parser recording the metadata of every packet in PacketColumns instead of
+    reassembling pes packets: only the psi is processed by handlers, the pcr
+    and the pes header timestamps are read directly from the packets.
+    """
+
+    def __init__(self, verbose=False):
+        super().__init__(verbose=verbose)
+        self.packets = PacketColumns()
+
+    def parse_pkt(self, data):
+        pid, ctrl = TsPacket.HEADER.unpack_from(data)
+        row = len(self.packets)
+        pkt = super().parse_pkt(data)
+
+        pusi = (pid & 0x4000) != 0
+        self.packets.add(self.pkt_offset, pid & 0x1FFF, ctrl & 0xF, pusi, ctrl >> 6,
+                         pkt is not None and pkt.discontinuity)
+        if pid & 0x8000:
+            return pkt
+
+        # pcr may also be carried by packets without payload
+        if ctrl & 0x20 and 7 <= data[4] <= 183 and data[5] & AdaptationField.FLAG_PCR:
+            self.packets.add_pcr(row, pid & 0x1FFF, AdaptationField(data[4:]).pcr)
+
+        if pkt is not None and pusi and self.pid_handlers.handlers[pkt.pid] is None:
+            self.record_pes_header(row, pkt.pid, pkt.payload)
+        return pkt
+
+    def on_packet_headers(self, data, headers: PacketHeaders, discontinuities: set):
+        packets = self.packets
+        first_row = len(packets)
+        count = headers.count
+        stride = self.pkt_stride
+        prefix = self.pkt_prefix
+
+        discontinuity = np.zeros(count, dtype=np.uint8)
+        discontinuity[list(discontinuities)] = 1
+        packets.extend(offset=self.stream_offset + np.arange(count, dtype=np.uint64) * stride,
+                       pid=headers.pid, cc=headers.continuity_counter, pusi=headers.pusi,
+                       scrambling=headers.scrambled, discontinuity=discontinuity)
+
+        units = np.frombuffer(data, dtype=np.uint8, count=count * stride).reshape(count, stride)
+        valid = headers.valid & ~headers.corrupted
+        has_pcr = (valid & headers.has_afield & (headers.afield_len >= 7) & (headers.afield_len <= 183)
+                   & ((units[:, prefix + 5] & AdaptationField.FLAG_PCR) != 0))
+        rows = np.flatnonzero(has_pcr)
+        if len(rows):
+            clock = units[rows, prefix + 6:prefix + 12].astype(np.int64)
+            base = (clock[:, 0] << 25) | (clock[:, 1] << 17) | (clock[:, 2] << 9) | (clock[:, 3] << 1) \
+                | (clock[:, 4] >> 7)
+            packets.extend(pcr_row=rows + first_row, pcr_pid=headers.pid[rows],
+                           pcr=base * 300 + (((clock[:, 4] & 0x1) << 8) | clock[:, 5]))
+
+        flags = np.frombuffer(self.pid_handlers.flags, dtype=np.uint8)[headers.pid]
+        pes_starts = np.flatnonzero(valid & headers.pusi & headers.has_payload
+                                    & ((flags & PidTable.FLAG_HANDLER) == 0))
+        for idx in pes_starts.tolist():
+            offset = idx * stride + prefix
+            payload_offset = offset + 4
+            if headers.has_afield[idx]:
+                payload_offset += int(headers.afield_len[idx]) + 1
+            self.record_pes_header(first_row + idx, int(headers.pid[idx]),
+                                   data[payload_offset:offset + self.TS_PKT_LEN])
+
+    def record_pes_header(self, row: int, pid: int, payload):
+        if len(payload) < PesHeader.FIXED_LEN or payload[0:3] != b'\x00\x00\x01':
+            return
+        try:
+            header = PesHeader(payload)
+        except struct.error as e:
+            self.warning("invalid pes header on pid 0x%04x: %s", pid, e)
+            return
+        self.packets.add_pes(row, pid, header.pts, header.dts)
+
+    def arrays(self) -> dict:
+        """
+        :returns the recorded columns as numpy arrays, along with the pcr pid of
+                 each program (program, program_pcr_pid)
+        """
+        arrays = self.packets.arrays()
+        programs = sorted(self.programs_pcr_pid.items())
+        arrays["program"] = np.array([program_id for program_id, _ in programs], dtype=np.uint16)
+        arrays["program_pcr_pid"] = np.array([pid for _, pid in programs], dtype=np.uint16)
+        return arrays
+
+    def save(self, path: str, compressed: bool = False):
+        """Export the recorded columns to a numpy .npz file, see arrays()"""
+        if compressed:
+            np.savez_compressed(path, **self.arrays())
+        else:
+            np.savez(path, **self.arrays())
@@ -0,0 +1,147 @@
+import ipaddress
+import socket
+import struct
+
+from tsdemux.demux import TsParser
+from tsdemux.logger import LogEnabled
+
+
+class UdpTsReceiver(LogEnabled):
+    """
+    Receive MPEG-TS over udp, raw (ex: 7 x 188 bytes datagrams) or RTP encapsulated,
+    and feed a TsParser in batches of datagrams received in a preallocated buffer
+    """
+
+    RTP_VERSION = 2
+    RTP_HEADER_LEN = 12
+    # datagrams further behind the last sequence number are a sender restart, not late ones
+    RTP_MAX_MISORDER = 100
+    # default number of datagrams per batch
+    BATCH_SIZE = 64
+    MAX_DATAGRAM_SIZE = 1500
+    RECV_BUFFER_SIZE = 4 * 1024 * 1024
+
+    def __init__(self, parser: TsParser, sock: socket.socket,
+                 batch_size: int = BATCH_SIZE, max_datagram_size: int = MAX_DATAGRAM_SIZE):
+        super().__init__(log_name="udp", prefix="[UDP]")
+        self.parser = parser
+        self.sock = sock
+        self.batch_size = batch_size
+        self.max_datagram_size = max_datagram_size
+        self.buffer = bytearray(batch_size * max_datagram_size)
+        self.view = memoryview(self.buffer)
+        self.running = False
+        self.datagrams = 0
+        self.rtp_datagrams = 0
+        self.rtp_seq = -1
+        # datagrams missing according to RTP sequence numbers
+        self.rtp_lost = 0
+        # late or duplicated datagrams according to RTP sequence numbers, dropped
+        self.rtp_out_of_order = 0
+
+    @classmethod
+    def open(cls, parser: TsParser, address: str, port: int, interface: str = "0.0.0.0", **kwargs):
+        """
+        Bind a udp socket to address:port, joining the group if address is multicast
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, cls.RECV_BUFFER_SIZE)
+        except OSError:
+            pass
+
+        if ipaddress.ip_address(address).is_multicast:
+            sock.bind(("", port))
+            mreq = struct.pack("4s4s", socket.inet_aton(address), socket.inet_aton(interface))
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+        else:
+            sock.bind((address, port))
+
+        return cls(parser, sock, **kwargs)
+
+    def close(self):
+        self.sock.close()
+
+    def strip_rtp(self, offset: int, size: int) -> (int, int):
+        """
+        Check for an RTP header at offset and update the sequence number stats
+        :returns start and end offsets of the ts data in the datagram, empty for
+                 late or duplicated datagrams
+        """
+        data = self.buffer
+        end = offset + size
+        if size < self.RTP_HEADER_LEN or data[offset] == TsParser.TS_SYNC_BYTE \
+                or (data[offset] >> 6) != self.RTP_VERSION:
+            return offset, end
+
+        self.rtp_datagrams += 1
+        header_len = self.RTP_HEADER_LEN + 4 * (data[offset] & 0x0F)
+        if data[offset] & 0x10 and header_len + 4 <= size:
+            # header extension
+            header_len += 4 + 4 * ((data[offset + header_len + 2] << 8) | data[offset + header_len + 3])
+        if data[offset] & 0x20:
+            # padding
+            end -= data[end - 1]
+
+        seq = (data[offset + 2] << 8) | data[offset + 3]
+        if self.rtp_seq >= 0:
+            gap = (seq - self.rtp_seq - 1) & 0xFFFF
+            if gap >= 0x8000 and (self.rtp_seq - seq) & 0xFFFF <= self.RTP_MAX_MISORDER:
+                # its ts packets were either already parsed or replaced by the following ones
+                self.rtp_out_of_order += 1
+                self.warning("dropping out of order rtp packet: %d after %d", seq, self.rtp_seq)
+                return offset, offset
+            if gap >= 0x8000:
+                self.warning("rtp sequence restarted: %d after %d", seq, self.rtp_seq)
+            elif gap:
+                self.rtp_lost += gap
+                self.warning("%d rtp packets lost before %d", gap, seq)
+        self.rtp_seq = seq
+
+        return offset + header_len, max(offset + header_len, end)
+
+    def receive_batch(self, timeout: float = None) -> int:
+        """
+        Wait up to timeout for a datagram, then receive the datagrams already
+        queued, up to the batch size, and feed them to the parser at once
+        :returns number of datagrams received
+        """
+        max_size = self.max_datagram_size
+        view = self.view
+        write = 0
+        count = 0
+
+        self.sock.settimeout(timeout)
+        try:
+            while count < self.batch_size:
+                try:
+                    size = self.sock.recv_into(view[write:write + max_size])
+                except (BlockingIOError, socket.timeout):
+                    break
+                if count == 0:
+                    self.sock.setblocking(False)
+                count += 1
+                if size == max_size:
+                    self.warning("datagram may have been truncated to %d bytes", size)
+
+                start, end = self.strip_rtp(write, size)
+                if start != write:
+                    view[write:write + end - start] = view[start:end]
+                write += end - start
+        finally:
+            self.sock.settimeout(timeout)
+
+        self.datagrams += count
+        if write:
+            self.parser.feed(view[:write])
+        return count
+
+    def run(self, timeout: float = 1.0):
+        """Receive until stop() is called"""
+        self.running = True
+        while self.running:
+            self.receive_batch(timeout)
+
+    def stop(self):
+        self.running = False
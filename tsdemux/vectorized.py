@@ -0,0 +1,119 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from tsdemux.pid_table import PidTable
+
+
+class PacketHeaders:
+    """
+    Header fields of a block of consecutive TS packets, decoded at once
+    """
+
+    PADDING_PID = 0x1FFF
+    SKIP_FLAGS = PidTable.FLAG_DROP | PidTable.FLAG_COUNT_ONLY
+
+    def __init__(self, data, count: int, stride: int = 188, prefix: int = 0):
+        """
+        :param stride: size of each packet in data, including prefix and trailer
+        :param prefix: size of the data preceding each packet sync byte
+        """
+        if np is None:
+            raise ImportError("numpy is required for vectorized parsing")
+
+        units = np.frombuffer(data, dtype=np.uint8, count=count * stride).reshape(count, stride)
+        pkts = units[:, prefix:prefix + 5]
+        self.count = count
+        if prefix:
+            # M2TS: 2 bits copy permission indicator + 30 bits arrival timestamp
+            self.arrival_timestamp = units[:, :4].copy().view(">u4").ravel() & 0x3FFFFFFF
+        else:
+            self.arrival_timestamp = None
+        self.sync = pkts[:, 0]
+        self.tei = (pkts[:, 1] & 0x80) != 0
+        self.pusi = (pkts[:, 1] & 0x40) != 0
+        self.pid = ((pkts[:, 1].astype(np.uint16) & 0x1F) << 8) | pkts[:, 2]
+        self.scrambled = pkts[:, 3] >> 6
+        self.afield_ctrl = (pkts[:, 3] >> 4) & 0x3
+        self.continuity_counter = pkts[:, 3] & 0xF
+        self.afield_len = pkts[:, 4]
+
+        self.has_payload = (self.afield_ctrl & 0x1) != 0
+        self.has_afield = (self.afield_ctrl & 0x2) != 0
+        # packets going through the continuity check and handlers
+        self.valid = (self.pid != self.PADDING_PID) & ~self.tei
+        self.corrupted = self.valid & self.has_payload & self.has_afield & (
+                (self.afield_len > 183) | ((self.afield_len == 183) & (self.afield_ctrl != 0x2)))
+
+    def sync_lost_at(self, sync_byte: int) -> int:
+        """
+        :returns index of the first packet not starting with the sync byte, -1 if all are in sync
+        """
+        lost = np.flatnonzero(self.sync != sync_byte)
+        if len(lost) == 0:
+            return -1
+        return int(lost[0])
+
+    def apply_pid_flags(self, pid_table: PidTable):
+        """
+        Select the packets going through the continuity check
+        """
+        flags = np.frombuffer(pid_table.flags, dtype=np.uint8)[self.pid]
+        self.cc_check = ((flags & PidTable.FLAG_CC_CHECK) != 0) & ((flags & self.SKIP_FLAGS) == 0)
+
+    def check_continuity(self, counters: dict):
+        """
+        Check continuity counters of all packets carrying a payload, per pid,
+        starting from the last counters seen in previous blocks. counters is
+        updated with the last counter seen for each pid in this block.
+        :returns indices of the packets with a continuity error
+        """
+        checked = np.flatnonzero(self.valid & self.has_payload & self.cc_check)
+        if len(checked) == 0:
+            return checked
+
+        pids = self.pid[checked]
+        order = np.argsort(pids, kind="stable")
+        pids = pids[order]
+        ccs = self.continuity_counter[checked][order]
+
+        first = np.ones(len(pids), dtype=bool)
+        first[1:] = pids[1:] != pids[:-1]
+        last = np.ones(len(pids), dtype=bool)
+        last[:-1] = first[1:]
+
+        expected = np.empty_like(ccs)
+        expected[1:] = (ccs[:-1] + 1) & 0xF
+        for idx in np.flatnonzero(first).tolist():
+            prev = counters.get(int(pids[idx]))
+            expected[idx] = ccs[idx] if prev is None else (prev + 1) & 0xF
+
+        counters.update(zip(pids[last].tolist(), ccs[last].tolist()))
+
+        errors = checked[order[ccs != expected]]
+        errors.sort()
+        return errors
+
+    def select(self, start: int, pid_table: PidTable) -> list:
+        """
+        :returns indices (from start) of the valid packets having a handler, carrying a pcr
+                 or whose adaptation field is decoded
+        """
+        flags = np.frombuffer(pid_table.flags, dtype=np.uint8)[self.pid[start:]]
+        # packets of count only pids, counted by count_pids() with the flags of this selection
+        self.counted = np.flatnonzero((flags & PidTable.FLAG_COUNT_ONLY) != 0) + start
+        mask = (self.valid[start:] & ~self.corrupted[start:]
+                & ((flags & (PidTable.FLAG_HANDLER | PidTable.FLAG_PCR | PidTable.FLAG_AFIELD)) != 0)
+                & ((flags & self.SKIP_FLAGS) == 0))
+        return (np.flatnonzero(mask) + start).tolist()
+
+    def count_pids(self, stop: int, pid_table: PidTable):
+        """
+        Count the packets of count only pids selected by the last select() call,
+        up to stop, where the pid flags may have changed
+        """
+        counted = self.pid[self.counted[self.counted < stop]]
+        if len(counted):
+            for pid, count in zip(*np.unique(counted, return_counts=True)):
+                pid_table.counts[int(pid)] += int(count)